@@ -0,0 +1,121 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from lua_bytecode import LuaBytecode
+from working_data import WorkingDataObjects
+
+TOOLING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tooling.py')
+
+def bench_startup(path):
+    # cold start of the CLI: process launch until the first prompt is written, stdin is a pipe so the
+    # prompt has to be asked for
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, TOOLING, '--plain', '--interactive', path],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+
+    output = b''
+    while not output.endswith(b'>> '):
+        data = process.stdout.read1(4096)
+        if len(data) == 0:
+            break
+        output += data
+    elapsed = time.perf_counter() - start
+
+    process.communicate(b'exit\n')
+    return elapsed
+
+def bench_load(path):
+    # parse time of the whole file, for comparison with the time to prompt
+    with open(path, 'rb') as file:
+        data = file.read()
+    start = time.perf_counter()
+    LuaBytecode.read(data)
+    elapsed = time.perf_counter() - start
+    WorkingDataObjects.clear()
+    return elapsed
+
+def bench_optimize(path):
+    # parse, optimization passes, serialization and the verifying re-parse
+    from optimizer import optimize, verify_output
+    with open(path, 'rb') as file:
+        data = file.read()
+    start = time.perf_counter()
+    bytecode = LuaBytecode.read(data)
+    optimize(bytecode)
+    verify_output(bytecode.write())
+    elapsed = time.perf_counter() - start
+    WorkingDataObjects.clear()
+    return elapsed
+
+def bench_fold(path):
+    # folded pseudo code of every function, uncached
+    from expression_folding import fold_chunk
+    from output_system import OutputSystem
+    with open(path, 'rb') as file:
+        data = file.read()
+    bytecode = LuaBytecode.read(data)
+    output_system = OutputSystem()
+    output_system.colored = False
+    start = time.perf_counter()
+    for function in bytecode.chunks:
+        fold_chunk(function.value, output_system)
+    elapsed = time.perf_counter() - start
+    WorkingDataObjects.clear()
+    return elapsed
+
+def measure_memory(path):
+    # bytes retained by a parsed file, and how much of the string constant storage interning shared
+    with open(path, 'rb') as file:
+        data = file.read()
+    tracemalloc.start()
+    bytecode = LuaBytecode.read(data)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # without interning every occurrence held its own copy
+    strings = [constant.value.string for function in bytecode.chunks for constant in function.value.constants
+               if constant.value.string is not None]
+    occurrences = sum(sys.getsizeof(string.raw) + sys.getsizeof(string.display()) for string in strings)
+    shared = sum(sys.getsizeof(string.raw) + sys.getsizeof(string.display()) for string in bytecode.strings)
+    WorkingDataObjects.clear()
+    return retained, len(strings), len(bytecode.strings), occurrences - shared
+
+Benchmarks = {
+    'startup': bench_startup,
+    'load': bench_load,
+    'optimize': bench_optimize,
+    'fold': bench_fold
+}
+
+def run(paths, names, repeat):
+    results = []
+    for path in paths:
+        for name in names:
+            timings = [Benchmarks[name](path) for i in range(repeat)]
+            results.append((name, path, min(timings), sum(timings) / len(timings)))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='Compiled Lua files to benchmark with.')
+    parser.add_argument('-b', '--benchmark', action='append', choices=list(Benchmarks), help='Benchmarks to run, all by default.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs per benchmark, the best and mean are reported.')
+    parser.add_argument('-m', '--memory', action='store_true', help='Report retained memory and string interning savings instead.')
+
+    args = parser.parse_args()
+    if args.memory:
+        print("{:<40} {:>12} {:>10} {:>10} {:>12}".format('file', 'retained KB', 'strings', 'unique', 'saved KB'))
+        for path in args.files:
+            retained, strings, unique, saved = measure_memory(path)
+            print("{:<40} {:>12.1f} {:>10} {:>10} {:>12.1f}".format(path, retained / 1024, strings, unique, saved / 1024))
+        sys.exit(0)
+
+    print("{:<12} {:<40} {:>10} {:>10}".format('benchmark', 'file', 'best ms', 'mean ms'))
+    for name, path, best, mean in run(args.files, args.benchmark or list(Benchmarks), args.repeat):
+        print("{:<12} {:<40} {:>10.2f} {:>10.2f}".format(name, path, best * 1000, mean * 1000))
@@ -0,0 +1,247 @@
+from array import array
+
+from control_flow import JumpOpcodes, jump_target
+from lua_instruction import LuaOpcode
+
+# opcodes that leave R(A) untouched
+NonWritingOpcodes = {
+    LuaOpcode.SETGLOBAL, LuaOpcode.SETUPVAL, LuaOpcode.SETTABLE,
+    LuaOpcode.JMP, LuaOpcode.EQ, LuaOpcode.LT, LuaOpcode.LE, LuaOpcode.TEST,
+    LuaOpcode.TAILCALL, LuaOpcode.RETURN, LuaOpcode.SETLIST, LuaOpcode.CLOSE
+}
+
+def adjacency(count, edges):
+    # compressed adjacency: the targets of node i are targets[offsets[i]:offsets[i + 1]]
+    edges = sorted(set(edges))
+    offsets = array('l', [0] * (count + 1))
+    for source, target in edges:
+        offsets[source + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    targets = array('l', [target for source, target in edges])
+    return offsets, targets
+
+class Reachability:
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+        self.components = self.strongly_connected()
+        self.members = None
+        self.cyclic = None
+        self.componentSuccessors = None
+        self.memo = {}
+
+    def successors(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def strongly_connected(self):
+        # iterative Tarjan, a file can nest deeper than the recursion limit
+        count = len(self.offsets) - 1
+        index = [-1] * count
+        low = [0] * count
+        onStack = [False] * count
+        component = [-1] * count
+        stack = []
+        counter = 0
+        numComponents = 0
+
+        for root in range(count):
+            if index[root] != -1:
+                continue
+            work = [(root, 0)]
+            while len(work) > 0:
+                node, position = work.pop()
+                if position == 0:
+                    index[node] = low[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    onStack[node] = True
+
+                successors = self.successors(node)
+                recursed = False
+                while position < len(successors):
+                    successor = successors[position]
+                    position += 1
+                    if index[successor] == -1:
+                        work.append((node, position))
+                        work.append((successor, 0))
+                        recursed = True
+                        break
+                    if onStack[successor]:
+                        low[node] = min(low[node], index[successor])
+                if recursed:
+                    continue
+
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        onStack[member] = False
+                        component[member] = numComponents
+                        if member == node:
+                            break
+                    numComponents += 1
+
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+        return component
+
+    def condense(self):
+        # the components form a DAG, reach is memoized per component on that DAG
+        count = max(self.components, default=-1) + 1
+        self.members = [0] * count
+        self.cyclic = [False] * count
+        self.componentSuccessors = [set() for i in range(count)]
+        for node, component in enumerate(self.components):
+            self.members[component] |= 1 << node
+            for successor in self.successors(node):
+                if self.components[successor] == component:
+                    self.cyclic[component] = True
+                else:
+                    self.componentSuccessors[component].add(self.components[successor])
+
+    def reach(self, node):
+        # bit mask of every node reachable from node through at least one edge
+        if self.members is None:
+            self.condense()
+
+        start = self.components[node]
+        work = [(start, False)]
+        while len(work) > 0:
+            component, expanded = work.pop()
+            if component in self.memo:
+                continue
+            if not expanded:
+                work.append((component, True))
+                work.extend((successor, False) for successor in self.componentSuccessors[component] if successor not in self.memo)
+                continue
+
+            mask = 0
+            for successor in self.componentSuccessors[component]:
+                mask |= self.members[successor] | self.memo[successor]
+            self.memo[component] = mask
+
+        if self.cyclic[start]:
+            return self.memo[start] | self.members[start]
+        return self.memo[start]
+
+def mask_nodes(mask):
+    nodes = []
+    while mask:
+        low = mask & -mask
+        nodes.append(low.bit_length() - 1)
+        mask ^= low
+    return nodes
+
+class CallGraph:
+    def __init__(self, bytecode):
+        self.functions = list(bytecode.chunks)
+        self.indices = {id(data.value): i for i, data in enumerate(self.functions)}
+
+        edges = []
+        bindings = {}
+        calls = []
+        for i, data in enumerate(self.functions):
+            self.scan_chunk(i, data.value, edges, bindings, calls)
+
+        # calls through globals resolve to every closure stored under that name anywhere in the file
+        for source, name in calls:
+            for target in bindings.get(name, []):
+                edges.append((source, target))
+
+        count = len(self.functions)
+        self.offsets, self.targets = adjacency(count, edges)
+        self.reverseOffsets, self.reverseTargets = adjacency(count, [(target, source) for source, target in edges])
+
+        self.forward = None
+        self.reverse = None
+
+    def scan_chunk(self, index, chunk, edges, bindings, calls):
+        instructions = chunk.instructions
+        jumpTargets = set()
+        for pc, instruction in enumerate(instructions):
+            if instruction.value.opcode in JumpOpcodes:
+                jumpTargets.add(jump_target(instruction.value, pc))
+
+        # what each register holds, as far as a linear walk can tell: ('global', name) or ('closure', index)
+        registers = {}
+        skip = 0
+        for pc, instruction in enumerate(instructions):
+            if skip > 0:
+                # pseudo instructions after CLOSURE describe the upvalues of the new closure
+                skip -= 1
+                continue
+            if pc in jumpTargets:
+                registers.clear()
+
+            instruction = instruction.value
+            opcode = instruction.opcode
+            A = instruction.get_register(0)
+
+            if opcode == LuaOpcode.CLOSURE:
+                child = chunk.chunks[instruction.get_register(1)]
+                target = self.indices[id(child)]
+                edges.append((index, target))
+                registers[A] = ('closure', target)
+                skip = child.numUpvalues
+            elif opcode == LuaOpcode.GETGLOBAL:
+                registers[A] = ('global', chunk.constants[instruction.get_register(1)].value.text())
+            elif opcode == LuaOpcode.SETGLOBAL:
+                value = registers.get(A)
+                if value is not None and value[0] == 'closure':
+                    bindings.setdefault(chunk.constants[instruction.get_register(1)].value.text(), []).append(value[1])
+            elif opcode == LuaOpcode.MOVE:
+                value = registers.get(instruction.get_register(1))
+                if value is None:
+                    registers.pop(A, None)
+                else:
+                    registers[A] = value
+            elif opcode in (LuaOpcode.CALL, LuaOpcode.TAILCALL):
+                value = registers.get(A)
+                if value is not None:
+                    if value[0] == 'global':
+                        calls.append((index, value[1]))
+                    else:
+                        edges.append((index, value[1]))
+                for register in [register for register in registers if register >= A]:
+                    del registers[register]
+            elif opcode in (LuaOpcode.VARARG, LuaOpcode.TFORLOOP):
+                for register in [register for register in registers if register >= A]:
+                    del registers[register]
+            elif opcode == LuaOpcode.LOADNIL:
+                for register in range(A, instruction.get_register(1) + 1):
+                    registers.pop(register, None)
+            elif opcode == LuaOpcode.SELF:
+                registers.pop(A, None)
+                registers.pop(A + 1, None)
+            elif opcode not in NonWritingOpcodes:
+                registers.pop(A, None)
+
+    def index_of(self, data):
+        return self.indices[id(data.value)]
+
+    def callees(self, data, transitive=False):
+        node = self.index_of(data)
+        if transitive:
+            if self.forward is None:
+                self.forward = Reachability(self.offsets, self.targets)
+            nodes = mask_nodes(self.forward.reach(node) & ~(1 << node))
+        else:
+            nodes = self.targets[self.offsets[node]:self.offsets[node + 1]]
+        return [self.functions[i] for i in nodes]
+
+    def callers(self, data, transitive=False):
+        node = self.index_of(data)
+        if transitive:
+            if self.reverse is None:
+                self.reverse = Reachability(self.reverseOffsets, self.reverseTargets)
+            nodes = mask_nodes(self.reverse.reach(node) & ~(1 << node))
+        else:
+            nodes = self.reverseTargets[self.reverseOffsets[node]:self.reverseOffsets[node + 1]]
+        return [self.functions[i] for i in nodes]
+
+    def reaches(self, source, target):
+        if self.forward is None:
+            self.forward = Reachability(self.offsets, self.targets)
+        return bool(self.forward.reach(self.index_of(source)) >> self.index_of(target) & 1)
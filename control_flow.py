@@ -0,0 +1,193 @@
+from lua_instruction import LuaOpcode, LuaRegisterName, isRK
+
+A, B, C, Bx, sBx = LuaRegisterName.A, LuaRegisterName.B, LuaRegisterName.C, LuaRegisterName.Bx, LuaRegisterName.sBx
+
+# instructions followed by a jump that is taken when the test fails, execution continues at pc + 1 or pc + 2
+ConditionalOpcodes = {LuaOpcode.EQ, LuaOpcode.LT, LuaOpcode.LE, LuaOpcode.TEST, LuaOpcode.TESTSET, LuaOpcode.TFORLOOP}
+JumpOpcodes = {LuaOpcode.JMP, LuaOpcode.FORLOOP, LuaOpcode.FORPREP}
+
+ArithmeticOpcodes = {LuaOpcode.ADD, LuaOpcode.SUB, LuaOpcode.MUL, LuaOpcode.DIV, LuaOpcode.MOD, LuaOpcode.POW}
+
+def jump_target(instruction, pc):
+    return pc + 1 + instruction.registers[sBx].value
+
+def operand_words(chunk, pc):
+    # words following an instruction that are its operands rather than instructions
+    instruction = chunk.instructions[pc].value
+    if instruction.opcode == LuaOpcode.CLOSURE:
+        return chunk.chunks[instruction.registers[Bx].value].numUpvalues
+    if instruction.opcode == LuaOpcode.SETLIST and instruction.registers[C].value == 0:
+        return 1
+    return 0
+
+def instruction_pcs(chunk):
+    # pcs of real instructions, skipping the operand words of CLOSURE and SETLIST
+    pc = 0
+    while pc < len(chunk.instructions):
+        yield pc
+        pc += 1 + operand_words(chunk, pc)
+
+def successors(chunk, pc):
+    instruction = chunk.instructions[pc].value
+    opcode = instruction.opcode
+    following = pc + 1 + operand_words(chunk, pc)
+    if opcode == LuaOpcode.RETURN:
+        return []
+    if opcode == LuaOpcode.JMP or opcode == LuaOpcode.FORPREP:
+        return [jump_target(instruction, pc)]
+    if opcode == LuaOpcode.FORLOOP:
+        return [following, jump_target(instruction, pc)]
+    if opcode in ConditionalOpcodes:
+        return [following, following + 1]
+    if opcode == LuaOpcode.LOADBOOL and instruction.registers[C].value != 0:
+        return [following + 1]
+    return [following]
+
+def basic_blocks(chunk):
+    # (start, end) pc ranges in code order, a block is entered only at its start and left only at its end
+    count = len(chunk.instructions)
+    pcs = list(instruction_pcs(chunk))
+    leaders = [False] * (count + 1)
+    leaders[0] = True
+    for pc in pcs:
+        following = pc + 1 + operand_words(chunk, pc)
+        targets = successors(chunk, pc)
+        if targets != [following]:
+            leaders[min(following, count)] = True
+            for target in targets:
+                if 0 <= target < count:
+                    leaders[target] = True
+
+    blocks = []
+    start = 0
+    for pc in pcs[1:]:
+        if leaders[pc]:
+            blocks.append((start, pc))
+            start = pc
+    if count > 0:
+        blocks.append((start, count))
+    return blocks
+
+def register_effects(chunk, pc, top=None):
+    # (read registers, written registers) of one instruction; a write that may not happen is also
+    # counted as a read, since the old value can flow past it. top is the first register of the
+    # results of a preceding CALL or VARARG with a variable count, when known
+    instruction = chunk.instructions[pc].value
+    opcode = instruction.opcode
+    registers = instruction.registers
+    a, b, c = registers[A].value, registers[B].value, registers[C].value
+
+    def rk(*values):
+        return [value for value in values if not isRK(value)]
+
+    def span(start, count):
+        # count - 1 registers from start, or everything up to the top of the stack for 0
+        if count != 0:
+            return list(range(start, start + count - 1))
+        return list(range(start, top + 1 if top is not None and top >= start else max(chunk.maxStackSize, start)))
+
+    if opcode == LuaOpcode.MOVE or opcode == LuaOpcode.UNM or opcode == LuaOpcode.NOT or opcode == LuaOpcode.LEN:
+        return [b], [a]
+    if opcode in [LuaOpcode.LOADK, LuaOpcode.LOADBOOL, LuaOpcode.GETUPVAL, LuaOpcode.GETGLOBAL, LuaOpcode.NEWTABLE]:
+        return [], [a]
+    if opcode == LuaOpcode.LOADNIL:
+        return [], list(range(a, b + 1))
+    if opcode == LuaOpcode.GETTABLE:
+        return [b] + rk(c), [a]
+    if opcode == LuaOpcode.SETGLOBAL or opcode == LuaOpcode.SETUPVAL or opcode == LuaOpcode.TEST:
+        return [a], []
+    if opcode == LuaOpcode.SETTABLE:
+        return [a] + rk(b, c), []
+    if opcode == LuaOpcode.SELF:
+        return [b] + rk(c), [a, a + 1]
+    if opcode in ArithmeticOpcodes:
+        return rk(b, c), [a]
+    if opcode == LuaOpcode.CONCAT:
+        return list(range(b, c + 1)), [a]
+    if opcode == LuaOpcode.EQ or opcode == LuaOpcode.LT or opcode == LuaOpcode.LE:
+        return rk(b, c), []
+    if opcode == LuaOpcode.TESTSET:
+        return [b, a], [a]
+    if opcode == LuaOpcode.CALL:
+        # with C = 0 the number of results is only known at run time, A is the only certain write
+        return span(a, b + 1 if b != 0 else 0), span(a, c) if c != 0 else [a]
+    if opcode == LuaOpcode.TAILCALL:
+        return span(a, b + 1 if b != 0 else 0), []
+    if opcode == LuaOpcode.RETURN:
+        return span(a, b), []
+    if opcode == LuaOpcode.FORLOOP:
+        return [a, a + 1, a + 2, a + 3], [a, a + 3]
+    if opcode == LuaOpcode.FORPREP:
+        return [a, a + 2], [a]
+    if opcode == LuaOpcode.TFORLOOP:
+        return [a, a + 1, a + 2], list(range(a + 3, a + 3 + c)) + [a + 2]
+    if opcode == LuaOpcode.SETLIST:
+        return [a] + span(a + 1, b + 1 if b != 0 else 0), []
+    if opcode == LuaOpcode.CLOSURE:
+        # upvalues captured from the enclosing function are MOVE pseudo-instructions after the CLOSURE
+        captured = []
+        for word in range(operand_words(chunk, pc)):
+            capture = chunk.instructions[pc + 1 + word].value
+            if capture.opcode == LuaOpcode.MOVE:
+                captured.append(capture.registers[B].value)
+        return captured, [a]
+    if opcode == LuaOpcode.VARARG:
+        return [], span(a, b) if b != 0 else [a]
+    return [], []
+
+def instruction_effects(chunk):
+    # register_effects per pc, None for operand words
+    effects = [None] * len(chunk.instructions)
+    top = None
+    for pc in instruction_pcs(chunk):
+        effects[pc] = register_effects(chunk, pc, top)
+        instruction = chunk.instructions[pc].value
+        top = None
+        if instruction.opcode == LuaOpcode.CALL and instruction.registers[C].value == 0:
+            top = instruction.registers[A].value
+        elif instruction.opcode == LuaOpcode.VARARG and instruction.registers[B].value == 0:
+            top = instruction.registers[A].value
+    return effects
+
+def live_registers(chunk, blocks, effects):
+    # registers live on exit of each block as int bitsets, effects is register_effects per pc
+    uses, defs = [], []
+    blockOf = {}
+    for index, (start, end) in enumerate(blocks):
+        use = define = 0
+        for pc in range(start, end):
+            if effects[pc] is None:
+                continue
+            reads, writes = effects[pc]
+            for register in reads:
+                if not define >> register & 1:
+                    use |= 1 << register
+            for register in writes:
+                define |= 1 << register
+        uses.append(use)
+        defs.append(define)
+        blockOf[start] = index
+
+    following = []
+    for start, end in blocks:
+        last = start
+        for pc in range(start, end):
+            if effects[pc] is not None:
+                last = pc
+        following.append([blockOf[target] for target in successors(chunk, last) if target in blockOf])
+
+    liveIn = [0] * len(blocks)
+    liveOut = [0] * len(blocks)
+    changed = True
+    while changed:
+        changed = False
+        for index in range(len(blocks) - 1, -1, -1):
+            out = 0
+            for successor in following[index]:
+                out |= liveIn[successor]
+            live = uses[index] | (out & ~defs[index])
+            if out != liveOut[index] or live != liveIn[index]:
+                liveOut[index] = out
+                liveIn[index] = live
+                changed = True
+    return liveOut
@@ -0,0 +1,579 @@
+import re
+
+from control_flow import A, B, C, Bx, ArithmeticOpcodes, basic_blocks, instruction_effects, jump_target, live_registers
+from lua_constant import LuaConstantType
+from lua_instruction import LuaOpcode, isRK
+from output_system import OutputType
+
+Identifier = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+Keywords = {
+    'and', 'break', 'do', 'else', 'elseif', 'end', 'false', 'for', 'function', 'if', 'in',
+    'local', 'nil', 'not', 'or', 'repeat', 'return', 'then', 'true', 'until', 'while'
+}
+
+Operators = {
+    LuaOpcode.ADD: '+',
+    LuaOpcode.SUB: '-',
+    LuaOpcode.MUL: '*',
+    LuaOpcode.DIV: '/',
+    LuaOpcode.MOD: '%',
+    LuaOpcode.POW: '^',
+    LuaOpcode.EQ: '==',
+    LuaOpcode.LT: '<',
+    LuaOpcode.LE: '<='
+}
+
+# operands of these are always printed as registers, their values are read more than once or outside the block
+UnfoldedOpcodes = {LuaOpcode.TESTSET, LuaOpcode.CLOSURE, LuaOpcode.FORLOOP, LuaOpcode.TFORLOOP}
+
+# registers an instruction can name, A + C - 2 of a CALL reaches past the 256 addressable ones
+REGISTER_SPACE = 1024
+
+# fields per set of SETLIST values
+FIELDS_PER_FLUSH = 50
+
+def is_identifier(text):
+    return Identifier.fullmatch(text) is not None and text not in Keywords
+
+def quote(text):
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+class ExpressionFolder:
+    # pseudo code with single-use temporaries folded into the expressions reading them, e.g.
+    # print(add(2, 2)) instead of five register assignments; each block is folded on its own from its
+    # instructions and the registers live at its end, so a block's lines can be cached and reused
+    def __init__(self, chunk, output_system):
+        self.chunk = chunk
+        self.output_system = output_system
+
+        self.effects = instruction_effects(chunk)
+        self.blocks = basic_blocks(chunk)
+        self.liveOut = live_registers(chunk, self.blocks, self.effects)
+
+        # per register state of the block being folded, flat lists reset only where a block touched them
+        self.text = [None] * REGISTER_SPACE       # expression not printed yet, None if there is none
+        self.target = [None] * REGISTER_SPACE     # left hand side it is printed with
+        self.atomic = [False] * REGISTER_SPACE    # can be an operand without parentheses
+        self.impure = [False] * REGISTER_SPACE    # reads globals, tables or upvalues, or calls
+        self.sequence = [0] * REGISTER_SPACE
+        self.row = [0] * REGISTER_SPACE
+        self.refs = [None] * REGISTER_SPACE       # registers the expression reads
+        self.readers = [None] * REGISTER_SPACE    # (register, sequence) of expressions reading this one
+        self.method = [None] * REGISTER_SPACE     # name of a SELF method, the object is in the next register
+
+    def fold(self):
+        lines = []
+        for index in range(len(self.blocks)):
+            lines.extend(self.fold_block(index))
+        return lines
+
+    def fold_block(self, index):
+        start, end = self.blocks[index]
+        self.rows = []
+        self.touched = []
+        self.impureOrder = []
+        self.front = 0
+        self.counter = 0
+        self.top = None
+        self.singles = self.single_uses(start, end, self.liveOut[index])
+
+        for pc in range(start, end):
+            if self.effects[pc] is not None:
+                self.fold_instruction(pc)
+
+        for register in self.touched:
+            self.flush(register)
+        for register in self.touched:
+            self.readers[register] = None
+            self.method[register] = None
+
+        output_system = self.output_system
+        output_system.load_format("{:<10} {:<15}")
+        for address, text, pc in self.rows:
+            if text:
+                output_system.add_data(hex(address), OutputType.ADDRESS)
+                output_system.add_data(text)
+                output_system.end_of_line()
+        lines = output_system.render_data()
+        output_system.clear_format()
+        return lines
+
+    def single_uses(self, start, end, liveOut):
+        # definitions in the block read exactly once before being overwritten and not live past its end,
+        # as pc << 10 | register mapped to the pc reading them
+        counts = {}
+        readers = {}
+        register = 0
+        while liveOut:
+            if liveOut & 1:
+                counts[register] = 2
+            liveOut >>= 1
+            register += 1
+
+        singles = {}
+        for pc in range(end - 1, start - 1, -1):
+            if self.effects[pc] is None:
+                continue
+            reads, writes = self.effects[pc]
+            for register in writes:
+                if counts.get(register, 0) == 1:
+                    singles[pc << 10 | register] = readers[register]
+                counts[register] = 0
+            for register in reads:
+                counts[register] = counts.get(register, 0) + 1
+                readers[register] = pc
+        return singles
+
+    # text
+
+    def register(self, register):
+        return f"R({self.output_system.color_from_type(register, OutputType.REGISTER)})"
+
+    def registers(self, start, end):
+        return ", ".join([self.register(register) for register in range(start, end + 1)])
+
+    def keyword(self, text):
+        return self.output_system.color_from_type(text, OutputType.KEYWORD)
+
+    def address(self, pc):
+        if pc < len(self.chunk.instructions):
+            return self.output_system.color_from_type(hex(self.chunk.instructions[pc].address), OutputType.ADDRESS)
+        return self.output_system.color_from_type('end', OutputType.ADDRESS)
+
+    def goto(self, pc):
+        return f"{self.keyword('goto')} {self.address(pc)}"
+
+    def constant(self, index):
+        constant = self.chunk.constants[index].value
+        if constant.type == LuaConstantType.String:
+            text = quote(constant.text())
+        elif constant.type == LuaConstantType.Number:
+            number = constant.literal
+            text = str(int(number)) if number.is_integer() and abs(number) < 2 ** 53 else repr(number)
+        elif constant.type == LuaConstantType.Boolean:
+            text = 'true' if constant.literal else 'false'
+        else:
+            text = 'nil'
+        return self.output_system.color_from_type(text, OutputType.CONSTANT)
+
+    def name(self, index):
+        # a string constant usable as a field or global name, or None
+        constant = self.chunk.constants[index].value
+        if constant.type == LuaConstantType.String and is_identifier(constant.text()):
+            return constant.text()
+        return None
+
+    def upvalue(self, index):
+        upvalues = self.chunk.debug['upvalues']
+        if index < len(upvalues):
+            return self.output_system.color_from_type(upvalues[index].value.name, OutputType.CONSTANT)
+        return f"upvalues[{self.output_system.color_from_type(index, OutputType.REGISTER)}]"
+
+    def closure(self, index):
+        child = self.chunk.chunks[index]
+        data = child.function
+        size = self.output_system.color_from_type(len(child.instructions), OutputType.NUMBER)
+        if data is not None and data.userDefinedTag is not None:
+            where = self.output_system.color_from_type(data.userDefinedTag, OutputType.TAG)
+        else:
+            where = self.output_system.color_from_type(hex(child.__startAddress__), OutputType.ADDRESS)
+        return f"{self.keyword('function')}[{size}] @ {where}"
+
+    def wrap(self, operand):
+        text, atomic = operand
+        return text if atomic else f"({text})"
+
+    def field(self, table, key):
+        # table.name when the key is a constant identifier, table[key] otherwise
+        if isRK(key):
+            name = self.name(key - 256)
+            if name is not None:
+                return f"{self.wrap(table)}.{name}"
+        return f"{self.wrap(table)}[{self.operand(key)[0]}]"
+
+    # register state
+
+    def flush(self, register):
+        # prints a pending expression as an assignment at the instruction that computed it
+        text = self.text[register]
+        if text is None:
+            return
+        if self.impure[register]:
+            self.flush_impure_before(self.sequence[register])
+        if self.method[register] is not None:
+            self.flush(register + 1)
+        self.text[register] = None
+        self.rows[self.row[register]][1] = f"{self.target[register]} = {text}"
+
+    def flush_impure_before(self, sequence):
+        # impure expressions keep their order, one computed earlier is printed before a later one is used
+        order = self.impureOrder
+        while self.front < len(order) and order[self.front][0] < sequence:
+            pending, register = order[self.front]
+            self.front += 1
+            if self.text[register] is not None and self.sequence[register] == pending:
+                self.flush(register)
+
+    def newest_impure(self, excluded):
+        # sequence of the latest pending impure expression outside excluded, or -1
+        order = self.impureOrder
+        index = len(order) - 1
+        while index >= self.front:
+            pending, register = order[index]
+            if self.text[register] is None or self.sequence[register] != pending:
+                if index == len(order) - 1:
+                    order.pop()
+            elif register not in excluded:
+                return pending
+            index -= 1
+        return -1
+
+    def encloses(self, register, result):
+        # whether the pending expression in register ends up in the same expression as the value this
+        # instruction puts in result, from a lower register; it was then evaluated before this call, and
+        # begin() of the instruction combining them checks it is also printed left of it
+        target = self.singles.get(self.row_pc(register) << 10 | register)
+        key = self.pc << 10 | result
+        while key in self.singles:
+            reader = self.singles[key]
+            if reader == target:
+                return register < result
+            if target is None or reader > target:
+                return False
+            result = self.chunk.instructions[reader].value.registers[A].value
+            key = reader << 10 | result
+        return False
+
+    def flush_unless_enclosing(self, result, limit):
+        order = self.impureOrder
+        kept = False
+        for index in range(self.front, len(order)):
+            pending, register = order[index]
+            if pending >= limit:
+                break
+            if self.text[register] is None or self.sequence[register] != pending:
+                if not kept:
+                    self.front = index + 1
+            elif self.encloses(register, result):
+                kept = True
+            else:
+                self.flush(register)
+                if not kept:
+                    self.front = index + 1
+
+    def clobber(self, register):
+        # the register is overwritten, expressions still reading its old value are printed first
+        readers = self.readers[register]
+        if readers is not None:
+            for reader, pending in readers:
+                if self.text[reader] is not None and self.sequence[reader] == pending:
+                    self.flush(reader)
+            readers.clear()
+        self.flush(register)
+
+    def begin(self, pc):
+        # decides which pending operands of the instruction are folded into it
+        self.pc = pc
+        self.refs_read = []
+        self.consumed = -1
+        self.impure_read = False
+
+        self.candidates = set()
+        if self.chunk.instructions[pc].value.opcode in UnfoldedOpcodes:
+            return
+        reads = self.effects[pc][0]
+        for register in reads:
+            if self.text[register] is not None and (self.row_pc(register) << 10 | register) in self.singles:
+                self.candidates.add(register)
+
+        # an impure expression is not moved past a later one that stays where it is
+        newest = self.newest_impure(self.candidates)
+        for register in list(self.candidates):
+            if self.impure[register] and self.sequence[register] < newest:
+                self.candidates.discard(register)
+
+        # reads are listed in the order the operands are printed, an impure operand is only folded when
+        # every one computed before it is printed left of it; otherwise it becomes an assignment, which
+        # prints the earlier ones first
+        earliest = None
+        for register in reversed(reads):
+            if register in self.candidates and self.impure[register]:
+                if earliest is not None and self.sequence[register] > earliest:
+                    self.candidates.discard(register)
+                earliest = self.sequence[register] if earliest is None else min(earliest, self.sequence[register])
+
+    def row_pc(self, register):
+        return self.rows[self.row[register]][2]
+
+    def use(self, register):
+        # the text of a register operand, folding its pending expression when it is read only here
+        text = self.text[register]
+        if text is None or register not in self.candidates or self.method[register] is not None:
+            self.flush(register)
+            self.refs_read.append(register)
+            return self.register(register), True
+
+        self.candidates.discard(register)
+        self.rows[self.row[register]][1] = False
+        self.text[register] = None
+        self.refs_read.extend(self.refs[register])
+        if self.impure[register]:
+            self.impure_read = True
+            self.consumed = max(self.consumed, self.sequence[register])
+        return text, self.atomic[register]
+
+    def operand(self, value):
+        if isRK(value):
+            return self.constant(value - 256), True
+        return self.use(value)
+
+    def end(self, writes, side_effect=False, result=None):
+        # after the operands are read: order impure expressions, then print what the writes overwrite.
+        # result is the register of the value when it may be folded, expressions it is folded into
+        # are evaluated before it and need not be printed
+        limit = self.counter + 1 if side_effect else self.consumed
+        if result is None or (self.pc << 10 | result) not in self.singles:
+            self.flush_impure_before(limit)
+        else:
+            self.flush_unless_enclosing(result, limit)
+        for register in writes:
+            self.clobber(register)
+
+    def statement(self, text):
+        self.rows.append([self.chunk.instructions[self.pc].address, text, self.pc])
+
+    def define(self, register, text, atomic=True, impure=False, target=None):
+        # register = text, kept pending while the value is read once later in the block
+        target = target if target is not None else self.register(register)
+        impure = impure or self.impure_read
+        if (self.pc << 10 | register) not in self.singles:
+            self.statement(f"{target} = {text}")
+            return
+
+        self.counter += 1
+        self.rows.append([self.chunk.instructions[self.pc].address, None, self.pc])
+        self.text[register] = text
+        self.target[register] = target
+        self.atomic[register] = atomic
+        self.impure[register] = impure
+        self.sequence[register] = self.counter
+        self.row[register] = len(self.rows) - 1
+        self.refs[register] = self.refs_read
+        for ref in self.refs_read:
+            if self.readers[ref] is None:
+                self.readers[ref] = []
+                self.touched.append(ref)
+            self.readers[ref].append((register, self.counter))
+        if impure:
+            self.impureOrder.append((self.counter, register))
+        self.touched.append(register)
+
+    def arguments(self, start, count):
+        # count values from start, or up to the top set by the last multiple result instruction for None
+        if count is not None:
+            return [self.use(register)[0] for register in range(start, start + count)]
+        if self.top is None or self.top < start:
+            return [self.register(start) + '...']
+        values = [self.use(register)[0] for register in range(start, self.top)]
+        text, atomic = self.use(self.top)
+        values.append(text if text != self.register(self.top) else text + '...')
+        self.top = None
+        return values
+
+    def multiple_writes(self, start):
+        # results up to the top of the stack
+        return list(range(start, max(self.chunk.maxStackSize, start + 1)))
+
+    # instructions
+
+    def fold_instruction(self, pc):
+        instruction = self.chunk.instructions[pc].value
+        opcode = instruction.opcode
+        registers = instruction.registers
+        a, b, c = registers[A].value, registers[B].value, registers[C].value
+        writes = self.effects[pc][1]
+        self.begin(pc)
+
+        if opcode == LuaOpcode.MOVE:
+            operand = self.use(b)
+            self.end(writes, result=a)
+            self.define(a, *operand)
+        elif opcode == LuaOpcode.LOADK:
+            self.end(writes)
+            self.define(a, self.constant(registers[Bx].value))
+        elif opcode == LuaOpcode.LOADBOOL:
+            value = self.output_system.color_from_type('true' if b != 0 else 'false', OutputType.CONSTANT)
+            self.end(writes)
+            if c != 0:
+                self.statement(f"{self.register(a)} = {value}; {self.goto(pc + 2)}")
+            else:
+                self.define(a, value)
+        elif opcode == LuaOpcode.LOADNIL:
+            self.end(writes)
+            nil = self.output_system.color_from_type('nil', OutputType.CONSTANT)
+            if a == b:
+                self.define(a, nil)
+            else:
+                self.statement(f"{self.registers(a, b)} = {nil}")
+        elif opcode == LuaOpcode.GETUPVAL:
+            self.end(writes)
+            self.define(a, self.upvalue(b), impure=True)
+        elif opcode == LuaOpcode.GETGLOBAL:
+            self.end(writes)
+            name = self.name(registers[Bx].value)
+            self.define(a, name if name is not None else f"_G[{self.constant(registers[Bx].value)}]", impure=True)
+        elif opcode == LuaOpcode.GETTABLE:
+            text = self.field(self.use(b), c)
+            self.end(writes, result=a)
+            self.define(a, text, impure=True)
+        elif opcode == LuaOpcode.SETGLOBAL:
+            value = self.use(a)[0]
+            self.end(writes, True)
+            name = self.name(registers[Bx].value)
+            self.statement(f"{name if name is not None else f'_G[{self.constant(registers[Bx].value)}]'} = {value}")
+        elif opcode == LuaOpcode.SETUPVAL:
+            value = self.use(a)[0]
+            self.end(writes, True)
+            self.statement(f"{self.upvalue(b)} = {value}")
+        elif opcode == LuaOpcode.SETTABLE:
+            table = self.use(a)
+            text = self.field(table, b)
+            value = self.operand(c)[0]
+            self.end(writes, True)
+            self.statement(f"{text} = {value}")
+        elif opcode == LuaOpcode.NEWTABLE:
+            self.end(writes)
+            self.define(a, '{}')
+        elif opcode == LuaOpcode.SELF:
+            self.fold_self(pc, a, b, c, writes)
+        elif opcode in ArithmeticOpcodes:
+            left, right = self.operand(b), self.operand(c)
+            self.end(writes, result=a)
+            self.define(a, f"{self.wrap(left)} {Operators[opcode]} {self.wrap(right)}", False)
+        elif opcode == LuaOpcode.UNM or opcode == LuaOpcode.NOT or opcode == LuaOpcode.LEN:
+            operand = self.wrap(self.use(b))
+            self.end(writes, result=a)
+            prefix = {LuaOpcode.UNM: '-', LuaOpcode.NOT: self.keyword('not') + ' ', LuaOpcode.LEN: '#'}[opcode]
+            self.define(a, prefix + operand, False)
+        elif opcode == LuaOpcode.CONCAT:
+            text = ' .. '.join([self.wrap(self.use(register)) for register in range(b, c + 1)])
+            self.end(writes, result=a)
+            self.define(a, text, False)
+        elif opcode == LuaOpcode.JMP:
+            self.end(writes)
+            self.statement(self.goto(jump_target(instruction, pc)))
+        elif opcode == LuaOpcode.EQ or opcode == LuaOpcode.LT or opcode == LuaOpcode.LE:
+            # the next instruction is skipped when the comparison differs from A
+            left, right = self.operand(b), self.operand(c)
+            self.end(writes, True)
+            comparison = f"{self.wrap(left)} {Operators[opcode]} {self.wrap(right)}"
+            if a != 0:
+                comparison = f"{self.wrap(left)} ~= {self.wrap(right)}" if opcode == LuaOpcode.EQ else f"{self.keyword('not')} ({comparison})"
+            self.statement(f"{self.keyword('if')} {comparison} {self.keyword('then')} {self.goto(pc + 2)}")
+        elif opcode == LuaOpcode.TEST:
+            value = self.use(a)
+            self.end(writes, True)
+            condition = value[0] if c == 0 else f"{self.keyword('not')} {self.wrap(value)}"
+            self.statement(f"{self.keyword('if')} {condition} {self.keyword('then')} {self.goto(pc + 2)}")
+        elif opcode == LuaOpcode.TESTSET:
+            value = self.use(b)
+            self.end(writes, True)
+            condition = value[0] if c == 0 else f"{self.keyword('not')} {self.wrap(value)}"
+            self.statement(f"{self.keyword('if')} {condition} {self.keyword('then')} {self.goto(pc + 2)} "
+                           f"{self.keyword('else')} {self.register(a)} = {value[0]}")
+        elif opcode == LuaOpcode.CALL:
+            self.fold_call(pc, a, b, c, writes)
+        elif opcode == LuaOpcode.TAILCALL:
+            function = self.wrap(self.use(a))
+            arguments = self.arguments(a + 1, b - 1 if b != 0 else None)
+            self.end(writes, True)
+            self.statement(f"{self.keyword('return')} {function}({', '.join(arguments)})")
+        elif opcode == LuaOpcode.RETURN:
+            values = self.arguments(a, b - 1 if b != 0 else None)
+            self.end(writes, True)
+            self.statement(' '.join([self.keyword('return')] + ([', '.join(values)] if len(values) > 0 else [])))
+        elif opcode == LuaOpcode.FORLOOP:
+            self.end(writes, True)
+            self.statement(f"{self.register(a)} += {self.register(a + 2)}; {self.keyword('if')} {self.register(a)} <= {self.register(a + 1)} "
+                           f"{self.keyword('then')} {self.register(a + 3)} = {self.register(a)}; {self.goto(jump_target(instruction, pc))}")
+        elif opcode == LuaOpcode.FORPREP:
+            start, step = self.use(a), self.use(a + 2)
+            self.end(writes, True)
+            self.statement(f"{self.register(a)} = {self.wrap(start)} - {self.wrap(step)}; {self.goto(jump_target(instruction, pc))}")
+        elif opcode == LuaOpcode.TFORLOOP:
+            self.end(writes, True)
+            self.statement(f"{self.registers(a + 3, a + 2 + c)} = {self.register(a)}({self.register(a + 1)}, {self.register(a + 2)}); "
+                           f"{self.keyword('if')} {self.register(a + 3)} ~= {self.output_system.color_from_type('nil', OutputType.CONSTANT)} "
+                           f"{self.keyword('then')} {self.register(a + 2)} = {self.register(a + 3)} {self.keyword('else')} {self.goto(pc + 2)}")
+        elif opcode == LuaOpcode.SETLIST:
+            # with C = 0 the set number is stored in the next word
+            flush = c if c != 0 else self.chunk.instructions[pc + 1].value.encode()
+            table = self.use(a)
+            values = self.arguments(a + 1, b if b != 0 else None)
+            self.end(writes, True)
+            first = self.output_system.color_from_type((flush - 1) * FIELDS_PER_FLUSH + 1, OutputType.NUMBER)
+            self.statement(f"{self.wrap(table)}[{first}...] = {', '.join(values)}")
+        elif opcode == LuaOpcode.CLOSE:
+            self.end(writes, True)
+            self.statement(f"{self.keyword('close')} {self.register(a)}...")
+        elif opcode == LuaOpcode.CLOSURE:
+            for register in self.effects[pc][0]:
+                self.use(register)
+            self.end(writes)
+            self.define(a, self.closure(registers[Bx].value))
+        elif opcode == LuaOpcode.VARARG:
+            self.end(writes if b != 0 else self.multiple_writes(a))
+            if b == 0:
+                self.define(a, '...', target=self.register(a) + '...')
+                self.top = a
+            elif b == 2:
+                self.define(a, '...')
+            else:
+                self.statement(f"{self.registers(a, a + b - 2)} = ...")
+
+    def fold_self(self, pc, a, b, c, writes):
+        # R(A + 1) = object; R(A) = object[C], folded into object:name(...) by the CALL that follows
+        obj = self.use(b)
+        name = self.name(c - 256) if isRK(c) else None
+        if name is None:
+            text = self.field((self.register(a + 1), True), c)
+            self.end(writes)
+            self.statement(f"{self.register(a + 1)} = {obj[0]}")
+            self.statement(f"{self.register(a)} = {text}")
+            return
+
+        self.end(writes)
+        self.define(a + 1, *obj)
+        self.refs_read = [a + 1]
+        self.impure_read = False
+        self.define(a, f"{self.register(a + 1)}.{name}")
+        if self.text[a] is not None:
+            self.method[a] = name
+
+    def fold_call(self, pc, a, b, c, writes):
+        if self.method[a] is not None and self.text[a] is not None and a in self.candidates and a + 1 in self.candidates:
+            name = self.method[a]
+            self.candidates.discard(a)
+            self.rows[self.row[a]][1] = False
+            self.text[a] = None
+            self.refs_read.append(a + 1)
+            function = f"{self.wrap(self.use(a + 1))}:{name}"
+            arguments = self.arguments(a + 2, b - 2 if b != 0 else None)
+        else:
+            function = self.wrap(self.use(a))
+            arguments = self.arguments(a + 1, b - 1 if b != 0 else None)
+        call = f"{function}({', '.join(arguments)})"
+
+        self.end(writes if c != 0 else self.multiple_writes(a), True, a if c == 0 or c == 2 else None)
+        if c == 1:
+            self.statement(call)
+        elif c == 2:
+            self.define(a, call, impure=True)
+        elif c == 0:
+            self.define(a, call, impure=True, target=self.register(a) + '...')
+            self.top = a
+        else:
+            self.statement(f"{self.registers(a, a + c - 2)} = {call}")
+
+def fold_chunk(chunk, output_system):
+    return ExpressionFolder(chunk, output_system).fold()
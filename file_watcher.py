@@ -0,0 +1,150 @@
+import hashlib
+import os
+
+from lua_chunk import LuaChunk
+from parallel_reader import open_mapped
+from working_data import WorkingData, WorkingType
+
+def prototype_paths(prototypeRange, path=()):
+    # (path of child indices, range) in DFS order
+    yield path, prototypeRange
+    for i, chunk in enumerate(prototypeRange.chunks):
+        yield from prototype_paths(chunk, path + (i,))
+
+def prototype_digest(stream, prototypeRange):
+    # nested prototypes are hashed on their own, so an edit inside a child does not invalidate its parents
+    childrenStart = prototypeRange.chunks[0].start if len(prototypeRange.chunks) > 0 else prototypeRange.debugStart
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(stream[prototypeRange.start:childrenStart])
+    digest.update(stream[prototypeRange.debugStart:prototypeRange.end])
+    return digest.digest()
+
+def own_working_data(chunk):
+    return [chunk.instructions, chunk.constants, chunk.debug['locals'], chunk.debug['upvalues']]
+
+class FileWatcher:
+    def __init__(self, path, bytecode):
+        self.path = path
+        self.bytecode = bytecode
+        self.stamp = None
+
+        self.header = None
+        self.prototypes = {}
+
+        stream = open_mapped(self.path)
+        self.stamp = self.file_stamp()
+        self.header = stream[:12]
+        mainRange = self.scan(stream)
+
+        functions = iter(self.bytecode.chunks)
+        for path, prototypeRange in prototype_paths(mainRange):
+            self.prototypes[path] = (prototype_digest(stream, prototypeRange), next(functions))
+        stream.close()
+
+    def file_stamp(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def byteorder(self):
+        return 'big' if self.bytecode.endianness.value == 0 else 'little'
+
+    def scan(self, stream):
+        stream.seek(12)
+        return LuaChunk.scan(self.byteorder(), self.bytecode.sizes(), stream)
+
+    def changed(self):
+        return self.file_stamp() != self.stamp
+
+    def reload(self):
+        # returns the prototypes that were decoded again and a lookup from replaced WorkingData to its successor,
+        # or None when the header changed and the file has to be read from scratch
+        stream = open_mapped(self.path)
+        self.stamp = self.file_stamp()
+        if stream[:12] != self.header:
+            stream.close()
+            return None
+
+        try:
+            mainRange = self.scan(stream)
+        except BaseException:
+            stream.close()
+            raise
+        byteorder, sizes = self.byteorder(), self.bytecode.sizes()
+
+        # unchanged prototypes are found by their digest wherever they are in the tree now, preferring their
+        # old path when several share a digest, so inserting or reordering functions keeps entries and tags
+        # with their functions
+        unclaimed = {}
+        for path, (digest, function) in self.prototypes.items():
+            unclaimed.setdefault(digest, {})[path] = function
+
+        # decode everything that changed before touching any state, a malformed file leaves it intact.
+        # The bytecode is the registry of its data, nothing registers with WorkingDataObjects
+        plan = []
+        try:
+            for path, prototypeRange in prototype_paths(mainRange):
+                digest = prototype_digest(stream, prototypeRange)
+                candidates = unclaimed.get(digest)
+                function = None
+                if candidates:
+                    function = candidates.pop(path) if path in candidates else candidates.pop(next(iter(candidates)))
+
+                chunk = None
+                if function is None:
+                    stream.seek(prototypeRange.start)
+                    chunk = LuaChunk.read(byteorder, sizes, stream, prototypeRange.debugStart, self.bytecode.strings, register=False)
+                plan.append((path, prototypeRange, digest, function, chunk))
+        finally:
+            stream.close()
+
+        # edited prototypes take over the entry left unclaimed at their path, if any
+        leftover = {path: function for candidates in unclaimed.values() for path, function in candidates.items()}
+
+        prototypes = {}
+        decoded = []
+        remapped = {}
+        moved = set()
+        for path, prototypeRange, digest, function, chunk in plan:
+            if chunk is None:
+                chunk = function.value
+                shift = prototypeRange.start - chunk.__startAddress__
+                if shift != 0:
+                    moved.add(path)
+                    chunk.__startAddress__ += shift
+                    for items in own_working_data(chunk):
+                        for data in items:
+                            data.address += shift
+            else:
+                moved.add(path)
+                decoded.append(chunk)
+
+                function = leftover.pop(path, None)
+                if function is None:
+                    function = WorkingData.from_data(WorkingType.FUNCTION, None, chunk, register=False)
+                else:
+                    # keep the function entry, and with it the user's tag, and carry tags over by position
+                    for oldItems, newItems in zip(own_working_data(function.value), own_working_data(chunk)):
+                        for oldData, newData in zip(oldItems, newItems):
+                            newData.userDefinedTag = oldData.userDefinedTag
+                            remapped[id(oldData)] = newData
+                    function.value = chunk
+
+            function.address = prototypeRange.start
+            function.value.function = function
+            prototypes[path] = (digest, function)
+
+        # relink the tree, kept chunks may have gained, lost or replaced children
+        for path, (digest, function) in prototypes.items():
+            function.value.chunks = []
+            if len(path) > 0:
+                prototypes[path[:-1]][1].value.chunks.append(function.value)
+
+        # rendered output shows addresses and the closures' addresses, so anything that moved renders differently
+        for path, (digest, function) in prototypes.items():
+            if path in moved or any(path + (i,) in moved for i in range(len(function.value.chunks))):
+                function.value.revision += 1
+
+        self.prototypes = prototypes
+        self.bytecode.chunks = [function for digest, function in prototypes.values()]
+
+        return decoded, remapped
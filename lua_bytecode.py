@@ -1,5 +1,10 @@
+from array import array
 from io import BytesIO
+import mmap
+
 from lua_chunk import LuaChunk
+from lua_constant import LuaStringTable
+from lua_reader import LuaBytecodeError, read_bytes
 from working_data import WorkingData, WorkingType
 
 class LuaBytecode:
@@ -15,33 +20,114 @@ class LuaBytecode:
         self.integralFlag = None
 
         self.chunks = []
+        self.strings = None
 
-
-    def read(bytes):
+    def read(bytes, strings=None, register=True):
+        # pass the same string table to several reads to share strings across files. With register=False
+        # nothing is added to WorkingDataObjects and the bytecode is the only registry of its data
         bytecode = LuaBytecode()
+        bytecode.strings = strings if strings is not None else LuaStringTable()
 
         stream = BytesIO(bytes)
+        byteorder = bytecode.read_header(stream, register)
+
+        mainChunk = LuaChunk.read(byteorder, bytecode.sizes(), stream, strings=bytecode.strings, register=register)
+        bytecode.add_chunks(mainChunk, register)
+
+        return bytecode
+
+    def read_header(self, stream, register=True):
+        self.signature = WorkingData.from_data(WorkingType.HEADER, 0, read_bytes(stream, 4), register)
+        self.version = WorkingData.from_data(WorkingType.HEADER, 4, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+        self.format = WorkingData.from_data(WorkingType.HEADER, 5, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+        self.endianness = WorkingData.from_data(WorkingType.HEADER, 6, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+        self.intSize = WorkingData.from_data(WorkingType.HEADER, 7, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+        self.sizeTSize = WorkingData.from_data(WorkingType.HEADER, 8, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+        self.instructionSize = WorkingData.from_data(WorkingType.HEADER, 9, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+        self.numberSize = WorkingData.from_data(WorkingType.HEADER, 10, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+        self.integralFlag = WorkingData.from_data(WorkingType.HEADER, 11, int.from_bytes(read_bytes(stream, 1), byteorder='little'), register)
+
+        return 'big' if self.endianness.value == 0 else 'little'
+
+    def byteorder(self):
+        return 'big' if self.endianness.value == 0 else 'little'
 
-        bytecode.signature = WorkingData.from_data(WorkingType.HEADER, 0, stream.read(4))
-        bytecode.version = WorkingData.from_data(WorkingType.HEADER, 4, int.from_bytes(stream.read(1), byteorder='little'))
-        bytecode.format = WorkingData.from_data(WorkingType.HEADER, 5, int.from_bytes(stream.read(1), byteorder='little'))
-        bytecode.endianness = WorkingData.from_data(WorkingType.HEADER, 6, int.from_bytes(stream.read(1), byteorder='little'))
-        bytecode.intSize = WorkingData.from_data(WorkingType.HEADER, 7, int.from_bytes(stream.read(1), byteorder='little'))
-        bytecode.sizeTSize = WorkingData.from_data(WorkingType.HEADER, 8, int.from_bytes(stream.read(1), byteorder='little'))
-        bytecode.instructionSize = WorkingData.from_data(WorkingType.HEADER, 9, int.from_bytes(stream.read(1), byteorder='little'))
-        bytecode.numberSize = WorkingData.from_data(WorkingType.HEADER, 10, int.from_bytes(stream.read(1), byteorder='little'))
-        bytecode.integralFlag = WorkingData.from_data(WorkingType.HEADER, 11, int.from_bytes(stream.read(1), byteorder='little'))
+    def write(self):
+        # serializes the header and the chunk tree, the result reads back with LuaBytecode.read
+        stream = BytesIO()
+        stream.write(self.signature.value)
+        for field in [self.version, self.format, self.endianness, self.intSize, self.sizeTSize,
+                      self.instructionSize, self.numberSize, self.integralFlag]:
+            stream.write(bytes([field.value]))
+        self.chunks[0].value.write(self.byteorder(), self.sizes(), stream)
+        return stream.getvalue()
 
-        byteorder = 'big' if bytecode.endianness.value == 0 else 'little'
+    def size(self):
+        return 12 + self.chunks[0].value.size(self.sizes())
 
-        mainChunk = LuaChunk.read(byteorder, [bytecode.intSize, bytecode.sizeTSize, bytecode.instructionSize, bytecode.numberSize], stream)
+    def sizes(self):
+        return [self.intSize, self.sizeTSize, self.instructionSize, self.numberSize]
 
+    def add_chunks(self, mainChunk, register=True):
         # DFS to read all the chunks
         def read_chunks(chunk):
-            bytecode.chunks.append(WorkingData.from_data(WorkingType.FUNCTION, chunk.__startAddress__, chunk))
+            chunk.function = WorkingData.from_data(WorkingType.FUNCTION, chunk.__startAddress__, chunk, register)
+            self.chunks.append(chunk.function)
             for c in chunk.chunks:
                 read_chunks(c)
         
         read_chunks(mainChunk)
 
-        return bytecode
\ No newline at end of file
+    def working_data(self):
+        # the WorkingData of this file in the order LuaBytecode.read creates it
+        yield from [self.signature, self.version, self.format, self.endianness, self.intSize, self.sizeTSize,
+                    self.instructionSize, self.numberSize, self.integralFlag]
+        yield from self.chunks[0].value.working_data()
+        yield from self.chunks
+
+    def unique_constants(self):
+        # deduplicated view of the constant pools: constant key -> every constant WorkingData with it
+        constants = {}
+        for function in self.chunks:
+            for constant in function.value.constants:
+                constants.setdefault(constant.value.key(), []).append(constant)
+        return constants
+
+def iter_prototypes(path, strings=None):
+    # yields (parent path, chunk) one prototype at a time in DFS order, where the path holds the child indexes
+    # from the main function down. Only the yielded chunk is decoded, its chunks are stubs with just the header
+    # fields of its children, which are yielded after it. Nothing registers with WorkingDataObjects, so a chunk
+    # is freed once the caller drops it and memory stays bounded by the largest function.
+    with open(path, 'rb') as file:
+        stream = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        if len(stream) < 12:
+            raise LuaBytecodeError("truncated header", len(stream))
+        byteorder = 'big' if stream[6] == 0 else 'little'
+        sizes = [WorkingData.from_data(WorkingType.HEADER, 7 + i, size, register=False) for i, size in enumerate(stream[7:11])]
+
+        # one frame per level: the child offsets of a prototype, the next child to visit and the prototype's path
+        frames = [(array('Q', [12]), [0], ())]
+        while len(frames) > 0:
+            starts, position, parentPath = frames[-1]
+            if position[0] == len(starts):
+                frames.pop()
+                continue
+            index = position[0]
+            position[0] += 1
+            path = parentPath + (index,) if len(frames) > 1 else ()
+
+            stream.seek(starts[index])
+            children, debugStart = LuaChunk.locate_children(byteorder, sizes, stream)
+
+            stream.seek(starts[index])
+            chunk = LuaChunk.read(byteorder, sizes, stream, debugStart, strings, register=False)
+            chunk.chunks = children
+
+            yield path, chunk
+            childStarts = array('Q', [child.__startAddress__ for child in children])
+            del chunk, children
+            frames.append((childStarts, [0], path))
+    finally:
+        stream.close()
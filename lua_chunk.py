@@ -1,16 +1,44 @@
 from io import BytesIO
 
 from lua_instruction import LuaInstruction
-from lua_constant import LuaConstant
+from lua_constant import LuaConstant, LuaConstantType
 from lua_local import LuaLocal
 from lua_upvalue import LuaUpvalue
 from working_data import WorkingData, WorkingType
+from lua_reader import LuaBytecodeError, read_bytes, read_string, skip_bytes
+from lua_writer import write_int, write_string
 
 def read_int(byteorder, stream: BytesIO, size: int) -> int:
     if size == 4:
-        return int.from_bytes(stream.read(4), byteorder=byteorder, signed=False)
+        return int.from_bytes(read_bytes(stream, 4), byteorder=byteorder, signed=False)
     elif size == 8:
-        return int.from_bytes(stream.read(8), byteorder=byteorder, signed=False)
+        return int.from_bytes(read_bytes(stream, 8), byteorder=byteorder, signed=False)
+
+def skip_string(byteorder, sizes, stream: BytesIO):
+    skip_bytes(stream, read_int(byteorder, stream, sizes[1].value))
+
+def skip_constants(byteorder, sizes, stream: BytesIO):
+    numberSize = sizes[3].value
+    for i in range(read_int(byteorder, stream, sizes[0].value)):
+        constantType = read_bytes(stream, 1)[0]
+        if constantType == 1:
+            skip_bytes(stream, 1)
+        elif constantType == 3:
+            skip_bytes(stream, numberSize)
+        elif constantType == 4:
+            skip_string(byteorder, sizes, stream)
+        elif constantType != 0:
+            # as LuaConstant.read, everything after it would be located wrongly
+            raise LuaBytecodeError(f"{constantType} is not a valid LuaConstantType", stream.tell() - 1)
+
+def skip_debug(byteorder, sizes, stream: BytesIO):
+    intSize = sizes[0].value
+    skip_bytes(stream, read_int(byteorder, stream, intSize) * 4)
+    for i in range(read_int(byteorder, stream, intSize)):
+        skip_string(byteorder, sizes, stream)
+        skip_bytes(stream, 8)
+    for i in range(read_int(byteorder, stream, intSize)):
+        skip_string(byteorder, sizes, stream)
 
 class LuaChunk:
     def __init__(self):
@@ -27,39 +55,20 @@ class LuaChunk:
         self.constants = []
         self.chunks = []
 
+        self.revision = 0 # bumped whenever rendered output of this chunk goes stale
+        self.function = None # the FUNCTION WorkingData of this chunk in its bytecode's chunks
+
         self.debug = {
             'lines': [],
             'locals': [],
             'upvalues': []
         }
         
-    def read(byteorder, sizes, stream: BytesIO):
-        intSize, sizeTSize = sizes[0].value, sizes[1].value
+    def read(byteorder, sizes, stream: BytesIO, debugStart=None, strings=None, register=True):
+        intSize = sizes[0].value
 
         chunk = LuaChunk()
-        chunk.__startAddress__ = stream.tell()
-
-        # read the size of the source string
-        size = read_int(byteorder, stream, sizeTSize)
-        chunk.source = stream.read(size).decode('utf-8')
-
-        # read the line defined for the chunk
-        chunk.lineDefined = read_int(byteorder, stream, intSize)
-
-        # read the last line defined for the chunk
-        chunk.lastLineDefined = read_int(byteorder, stream, intSize)
-
-        # read the number of upvalues
-        chunk.numUpvalues = int.from_bytes(stream.read(1), byteorder=byteorder)
-
-        # read the number of parameters
-        chunk.numParameters = int.from_bytes(stream.read(1), byteorder=byteorder)
-
-        # read the vararg flag
-        chunk.isVararg = int.from_bytes(stream.read(1), byteorder=byteorder)
-
-        # read the maximum stack size
-        chunk.maxStackSize = int.from_bytes(stream.read(1), byteorder=byteorder)
+        chunk.read_header(byteorder, sizes, stream)
 
         # read the instructions
         numInstructions = read_int(byteorder, stream, intSize)
@@ -67,33 +76,208 @@ class LuaChunk:
             startAddress = stream.tell()
             instruction = LuaInstruction.read(byteorder, sizes, stream)
             instruction.chunk = chunk
-            chunk.instructions.append(WorkingData.from_data(WorkingType.INSTRUCTION, startAddress, instruction))
+            chunk.instructions.append(WorkingData.from_data(WorkingType.INSTRUCTION, startAddress, instruction, register))
 
         # read the constants
         numConstants = read_int(byteorder, stream, intSize)
         for i in range(numConstants):
             startAddress = stream.tell()
-            chunk.constants.append(WorkingData.from_data(WorkingType.CONSTANT, startAddress, LuaConstant.read(byteorder, sizes, stream)))
+            chunk.constants.append(WorkingData.from_data(WorkingType.CONSTANT, startAddress, LuaConstant.read(byteorder, sizes, stream, strings), register))
 
         # read other prototypes
-        for i in range(read_int(byteorder, stream, intSize)):
-            nextChunk = LuaChunk.read(byteorder, sizes, stream)
-            chunk.chunks.append(nextChunk)
+        numChunks = read_int(byteorder, stream, intSize)
+        if debugStart is None:
+            for i in range(numChunks):
+                nextChunk = LuaChunk.read(byteorder, sizes, stream, strings=strings, register=register)
+                chunk.chunks.append(nextChunk)
+        else:
+            # the prototypes were located by a scan and are decoded on their own, skip over them
+            stream.seek(debugStart)
         
         # read the debug information
         for i in range(read_int(byteorder, stream, intSize)):
-            chunk.debug['lines'].append(stream.read(4))
+            chunk.debug['lines'].append(read_bytes(stream, 4))
 
         for i in range(read_int(byteorder, stream, intSize)):
             startAddress = stream.tell()
             chunk.debug['locals'].append(
-                WorkingData.from_data(WorkingType.LOCAL, startAddress, LuaLocal.read(byteorder, sizes, stream))
+                WorkingData.from_data(WorkingType.LOCAL, startAddress, LuaLocal.read(byteorder, sizes, stream), register)
             )
 
         for i in range(read_int(byteorder, stream, intSize)):
             startAddress = stream.tell()
             chunk.debug['upvalues'].append(
-                WorkingData.from_data(WorkingType.UPVALUE, startAddress, LuaUpvalue.read(byteorder, sizes, stream))
+                WorkingData.from_data(WorkingType.UPVALUE, startAddress, LuaUpvalue.read(byteorder, sizes, stream), register)
             )
 
-        return chunk
\ No newline at end of file
+        return chunk
+
+    def read_header(self, byteorder, sizes, stream: BytesIO):
+        intSize, sizeTSize = sizes[0].value, sizes[1].value
+        self.__startAddress__ = stream.tell()
+
+        # read the size of the source string
+        size = read_int(byteorder, stream, sizeTSize)
+        self.source = read_string(stream, size, 'utf-8')
+
+        # read the line defined for the chunk
+        self.lineDefined = read_int(byteorder, stream, intSize)
+
+        # read the last line defined for the chunk
+        self.lastLineDefined = read_int(byteorder, stream, intSize)
+
+        # read the number of upvalues
+        self.numUpvalues = int.from_bytes(read_bytes(stream, 1), byteorder=byteorder)
+
+        # read the number of parameters
+        self.numParameters = int.from_bytes(read_bytes(stream, 1), byteorder=byteorder)
+
+        # read the vararg flag
+        self.isVararg = int.from_bytes(read_bytes(stream, 1), byteorder=byteorder)
+
+        # read the maximum stack size
+        self.maxStackSize = int.from_bytes(read_bytes(stream, 1), byteorder=byteorder)
+
+    def working_data(self):
+        # yields the WorkingData of this tree in the same order LuaChunk.read creates it
+        yield from self.instructions
+        yield from self.constants
+        for chunk in self.chunks:
+            yield from chunk.working_data()
+        yield from self.debug['locals']
+        yield from self.debug['upvalues']
+
+    def write(self, byteorder, sizes, stream: BytesIO):
+        # the inverse of read, fields are written in the order they are read
+        intSize, sizeTSize = sizes[0].value, sizes[1].value
+
+        write_string(byteorder, stream, self.source.encode('utf-8'), sizeTSize)
+        write_int(byteorder, stream, self.lineDefined, intSize)
+        write_int(byteorder, stream, self.lastLineDefined, intSize)
+        for value in [self.numUpvalues, self.numParameters, self.isVararg, self.maxStackSize]:
+            write_int(byteorder, stream, value, 1)
+
+        write_int(byteorder, stream, len(self.instructions), intSize)
+        for instruction in self.instructions:
+            instruction.value.write(byteorder, sizes, stream)
+
+        write_int(byteorder, stream, len(self.constants), intSize)
+        for constant in self.constants:
+            constant.value.write(byteorder, sizes, stream)
+
+        write_int(byteorder, stream, len(self.chunks), intSize)
+        for chunk in self.chunks:
+            chunk.write(byteorder, sizes, stream)
+
+        write_int(byteorder, stream, len(self.debug['lines']), intSize)
+        for line in self.debug['lines']:
+            stream.write(line)
+
+        write_int(byteorder, stream, len(self.debug['locals']), intSize)
+        for local in self.debug['locals']:
+            local.value.write(byteorder, sizes, stream)
+
+        write_int(byteorder, stream, len(self.debug['upvalues']), intSize)
+        for upvalue in self.debug['upvalues']:
+            upvalue.value.write(byteorder, sizes, stream)
+
+    def size(self, sizes):
+        # serialized size in bytes, computed from the field sizes without writing anything
+        intSize, sizeTSize, instructionSize, numberSize = [size.value for size in sizes]
+        constantSizes = {
+            LuaConstantType.NONE: 1,
+            LuaConstantType.Boolean: 2,
+            LuaConstantType.Number: 1 + numberSize
+        }
+
+        size = sizeTSize + len(self.source.encode('utf-8')) + intSize * 2 + 4
+        size += intSize + len(self.instructions) * instructionSize
+        size += intSize
+        for constant in self.constants:
+            constant = constant.value
+            if constant.string is not None:
+                size += 1 + sizeTSize + len(constant.string.raw)
+            else:
+                size += constantSizes[constant.type]
+        size += intSize + sum(chunk.size(sizes) for chunk in self.chunks)
+        size += intSize + len(self.debug['lines']) * 4
+        size += intSize + sum(sizeTSize + len(local.value.name) + 8 for local in self.debug['locals'])
+        size += intSize + sum(sizeTSize + len(upvalue.value.name.encode('utf-8')) for upvalue in self.debug['upvalues'])
+        return size
+
+    def scan(byteorder, sizes, stream: BytesIO):
+        intSize, instructionSize = sizes[0].value, sizes[2].value
+
+        prototypeRange = LuaPrototypeRange()
+        prototypeRange.start = stream.tell()
+
+        # source, line defined, last line defined, upvalues, parameters, vararg flag, max stack size
+        skip_string(byteorder, sizes, stream)
+        skip_bytes(stream, intSize * 2)
+        prototypeRange.numUpvalues = read_bytes(stream, 1)[0]
+        skip_bytes(stream, 3)
+
+        prototypeRange.numInstructions = read_int(byteorder, stream, intSize)
+        prototypeRange.codeStart = stream.tell()
+        skip_bytes(stream, prototypeRange.numInstructions * instructionSize)
+        skip_constants(byteorder, sizes, stream)
+
+        for i in range(read_int(byteorder, stream, intSize)):
+            prototypeRange.chunks.append(LuaChunk.scan(byteorder, sizes, stream))
+        prototypeRange.debugStart = stream.tell()
+        skip_debug(byteorder, sizes, stream)
+
+        prototypeRange.end = stream.tell()
+        return prototypeRange
+
+    def skip(byteorder, sizes, stream: BytesIO):
+        # like scan, but only advances the stream and keeps nothing
+        intSize = sizes[0].value
+        skip_string(byteorder, sizes, stream)
+        skip_bytes(stream, intSize * 2 + 4)
+        skip_bytes(stream, read_int(byteorder, stream, intSize) * sizes[2].value)
+        skip_constants(byteorder, sizes, stream)
+        for i in range(read_int(byteorder, stream, intSize)):
+            LuaChunk.skip(byteorder, sizes, stream)
+        skip_debug(byteorder, sizes, stream)
+
+    def locate_children(byteorder, sizes, stream: BytesIO):
+        # stubs of a prototype's direct children holding only their header fields, and the offset of the
+        # prototype's own debug information
+        intSize = sizes[0].value
+        LuaChunk().read_header(byteorder, sizes, stream)
+        skip_bytes(stream, read_int(byteorder, stream, intSize) * sizes[2].value)
+        skip_constants(byteorder, sizes, stream)
+
+        children = []
+        for i in range(read_int(byteorder, stream, intSize)):
+            start = stream.tell()
+            child = LuaChunk()
+            child.read_header(byteorder, sizes, stream)
+            stream.seek(start)
+            LuaChunk.skip(byteorder, sizes, stream)
+            children.append(child)
+        return children, stream.tell()
+
+class LuaPrototypeRange:
+    def __init__(self):
+        self.start = None
+        self.codeStart = None
+        self.numUpvalues = None
+        self.numInstructions = None
+        self.debugStart = None
+        self.end = None
+
+        self.chunks = []
+
+    def flatten(self):
+        # DFS order, matching LuaBytecode.chunks
+        ranges = [self]
+        for chunk in self.chunks:
+            ranges.extend(chunk.flatten())
+        return ranges
+
+    def own_size(self):
+        # bytes belonging to this prototype alone, excluding nested prototypes
+        childrenSize = sum(chunk.end - chunk.start for chunk in self.chunks)
+        return self.end - self.start - childrenSize
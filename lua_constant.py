@@ -2,6 +2,9 @@ from io import BytesIO
 from enum import Enum
 import struct
 
+from lua_reader import LuaBytecodeError, read_bytes
+from lua_writer import write_int, write_string
+
 class LuaConstantType(Enum):
     NONE = 0
     Boolean = 1
@@ -11,25 +14,98 @@ class LuaConstantType(Enum):
     def __str__(self):
         return self.name.lower()
 
+class LuaString:
+    # raw bytes as stored in the file, the decoded forms are only built when asked for
+    def __init__(self, raw):
+        self.raw = raw
+        self.displayForm = None
+
+    def display(self):
+        # quoted and keeping the trailing NUL, as printed by the listings
+        if self.displayForm is None:
+            self.displayForm = '"' + self.raw.decode('utf-8', errors='backslashreplace') + '"'
+        return self.displayForm
+
+    def text(self):
+        return self.raw.rstrip(b'\x00').decode('utf-8', errors='backslashreplace')
+
+class LuaStringTable:
+    # interned string constants, one per LuaBytecode or shared by every file of a corpus
+    def __init__(self):
+        self.strings = {}
+
+    def intern(self, raw):
+        string = self.strings.get(raw)
+        if string is None:
+            string = LuaString(raw)
+            self.strings[raw] = string
+        return string
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings.values())
+
 class LuaConstant:
     def __init__(self):
         self.type = None
-        self.value = None
+        self.literal = None
+        self.string = None
+
+    @property
+    def value(self):
+        if self.string is not None:
+            return self.string.display()
+        return self.literal
+
+    @value.setter
+    def value(self, value):
+        self.literal = value
+        self.string = None
 
-    def read(byteorder, sizes, stream: BytesIO):
+    def key(self):
+        # equal constants have equal keys, strings compare by their raw bytes
+        if self.string is not None:
+            return (self.type, self.string.raw)
+        if self.type == LuaConstantType.Number:
+            # by bit pattern, 0.0 and -0.0 are different constants and NaN equals itself
+            return (self.type, struct.pack('d', self.literal))
+        return (self.type, self.literal)
+
+    def read(byteorder, sizes, stream: BytesIO, strings=None):
         sizeTSize, numberSize = sizes[1].value, sizes[3].value
         constant = LuaConstant()
 
-        constant.type = LuaConstantType(int.from_bytes(stream.read(1), byteorder=byteorder))
+        address = stream.tell()
+        try:
+            constant.type = LuaConstantType(int.from_bytes(read_bytes(stream, 1), byteorder=byteorder))
+        except ValueError as e:
+            raise LuaBytecodeError(str(e), address)
 
         if constant.type == LuaConstantType.Boolean:
-            constant.value = int.from_bytes(stream.read(1), byteorder=byteorder) == 1
+            constant.value = int.from_bytes(read_bytes(stream, 1), byteorder=byteorder) == 1
         elif constant.type == LuaConstantType.Number:
-            number = stream.read(numberSize)
+            number = read_bytes(stream, numberSize)
             constant.value = struct.unpack('d', number)[0]
         elif constant.type == LuaConstantType.String:
-            size = int.from_bytes(stream.read(sizeTSize), byteorder=byteorder)
-            constant.value = stream.read(size)
-            constant.value = '"' + constant.value.decode('utf-8') + '"'
+            size = int.from_bytes(read_bytes(stream, sizeTSize), byteorder=byteorder)
+            raw = read_bytes(stream, size)
+            constant.string = strings.intern(raw) if strings is not None else LuaString(raw)
+
+        return constant
+
+    def write(self, byteorder, sizes, stream: BytesIO):
+        sizeTSize = sizes[1].value
+        write_int(byteorder, stream, self.type.value, 1)
+        if self.type == LuaConstantType.Boolean:
+            write_int(byteorder, stream, 1 if self.literal else 0, 1)
+        elif self.type == LuaConstantType.Number:
+            stream.write(struct.pack('d', self.literal))
+        elif self.type == LuaConstantType.String:
+            write_string(byteorder, stream, self.string.raw, sizeTSize)
 
-        return constant
\ No newline at end of file
+    def text(self):
+        if self.string is not None:
+            return self.string.text()
+        return self.literal
\ No newline at end of file
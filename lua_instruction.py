@@ -1,8 +1,9 @@
 from io import BytesIO
 from enum import IntEnum, Enum, auto
-from termcolor import colored
 from output_system import OutputSystem, OutputType
-from working_data import WorkingDataObjects, WorkingType, WorkingData
+from working_data import WorkingType, WorkingData
+from lua_reader import LuaBytecodeError, read_bytes
+from lua_writer import write_int
 
 class LuaOpcode(IntEnum):
     MOVE = 0
@@ -184,11 +185,17 @@ class LuaInstruction:
 
     def read(byteorder, sizes, stream: BytesIO):
         instructionSize = sizes[2].value
-        instruction = LuaInstruction()
+        address = stream.tell()
+        raw = int.from_bytes(read_bytes(stream, instructionSize), byteorder=byteorder, signed=False)
+        return LuaInstruction.decode(raw, address)
 
-        raw = int.from_bytes(stream.read(instructionSize), byteorder=byteorder, signed=False)
+    def decode(raw, address=None):
+        instruction = LuaInstruction()
 
-        instruction.opcode = LuaOpcode(raw & 0x3F)
+        try:
+            instruction.opcode = LuaOpcode(raw & 0x3F)
+        except ValueError as e:
+            raise LuaBytecodeError(str(e), address)
         instruction.type = InstructionTypeLookup[instruction.opcode]
 
         if instruction.type == LuaInstructionType.A:
@@ -213,6 +220,21 @@ class LuaInstruction:
             instruction.registers[LuaRegisterName.sBx].value = ((raw >> 14) & 0x3FFFF) - 131071
 
         return instruction
+
+    def encode(self):
+        # fields a format does not use are None and stay zero
+        raw = int(self.opcode)
+        fields = [(LuaRegisterName.A, 6, 0), (LuaRegisterName.B, 23, 0), (LuaRegisterName.C, 14, 0),
+                  (LuaRegisterName.Bx, 14, 0), (LuaRegisterName.sBx, 14, 131071)]
+        for name, shift, bias in fields:
+            value = self.registers[name].value
+            if value is not None:
+                raw |= (value + bias) << shift
+        return raw
+
+    def write(self, byteorder, sizes, stream: BytesIO):
+        write_int(byteorder, stream, self.encode(), sizes[2].value)
+
     
     def get_register(self, index: int):
         if index == 0:
@@ -457,16 +479,18 @@ class LuaInstruction:
                 reg1 = reg(0)
                 kw1 = output_system.color_from_type("function", OutputType.KEYWORD)
 
+                # the child's function entry carries its tag, resolved through the chunk tree rather than
+                # the global registry so bytecode that never registered its data renders as well
                 closure = self.chunk.chunks[self.get_register(1)]
-                closure = [data for data in WorkingDataObjects if data.address == closure.__startAddress__][0]
+                function = closure.function
 
-                sizeCode = output_system.color_from_type(len(closure.value.instructions), OutputType.NUMBER)
+                sizeCode = output_system.color_from_type(len(closure.instructions), OutputType.NUMBER)
 
                 addressOrTag = None
-                if closure.userDefinedTag is None:
-                    addressOrTag = output_system.color_from_type(hex(closure.address), OutputType.ADDRESS)
+                if function is None or function.userDefinedTag is None:
+                    addressOrTag = output_system.color_from_type(hex(closure.__startAddress__), OutputType.ADDRESS)
                 else:
-                    addressOrTag = output_system.color_from_type(closure.userDefinedTag, OutputType.TAG)
+                    addressOrTag = output_system.color_from_type(function.userDefinedTag, OutputType.TAG)
                 output_system.add_data(line.format(reg1, kw1, sizeCode, addressOrTag))
             case LuaOpcode.VARARG:
                 output_system.add_data("TODO: VARARG")
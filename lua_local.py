@@ -1,10 +1,12 @@
 from io import BytesIO
+from lua_reader import read_bytes, read_string
+from lua_writer import write_string
 
 def read_int(byteorder, stream: BytesIO, size: int) -> int:
     if size == 4:
-        return int.from_bytes(stream.read(4), byteorder=byteorder)
+        return int.from_bytes(read_bytes(stream, 4), byteorder=byteorder)
     elif size == 8:
-        return int.from_bytes(stream.read(8), byteorder=byteorder)
+        return int.from_bytes(read_bytes(stream, 8), byteorder=byteorder)
 
 class LuaLocal:
     def __init__(self):
@@ -16,11 +18,16 @@ class LuaLocal:
         sizeTSize = sizes[1].value
         local = LuaLocal()
 
-        local.name = stream.read(
-            read_int(byteorder, stream, sizeTSize)
-        ).decode('ascii')
+        local.name = read_string(stream,
+            read_int(byteorder, stream, sizeTSize), 'ascii'
+        )
 
-        local.start = stream.read(4)
-        local.end = stream.read(4)
+        local.start = read_bytes(stream, 4)
+        local.end = read_bytes(stream, 4)
 
-        return local
\ No newline at end of file
+        return local
+
+    def write(self, byteorder, sizes, stream: BytesIO):
+        write_string(byteorder, stream, self.name.encode('ascii'), sizes[1].value)
+        stream.write(self.start)
+        stream.write(self.end)
\ No newline at end of file
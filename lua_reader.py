@@ -0,0 +1,40 @@
+from io import BytesIO
+import mmap
+
+class LuaBytecodeError(Exception):
+    def __init__(self, message, address=None):
+        super().__init__(message if address is None else f"{message} @ {hex(address)}")
+        self.address = address
+
+def remaining_bytes(stream: BytesIO) -> int:
+    # scans read mapped files field by field, their length is known without seeking
+    if isinstance(stream, mmap.mmap):
+        return len(stream) - stream.tell()
+    address = stream.tell()
+    stream.seek(0, 2)
+    end = stream.tell()
+    stream.seek(address)
+    return end - address
+
+def read_bytes(stream: BytesIO, size: int) -> bytes:
+    # int.from_bytes happily accepts short reads, so truncation has to be caught here. A corrupted
+    # size field can be far beyond what read() accepts, so it is checked before reading
+    address = stream.tell()
+    remaining = remaining_bytes(stream)
+    if size > remaining:
+        raise LuaBytecodeError(f"unexpected end of file, wanted {size} bytes but got {remaining}", address)
+    return stream.read(size)
+
+def read_string(stream: BytesIO, size: int, encoding: str) -> str:
+    address = stream.tell()
+    try:
+        return read_bytes(stream, size).decode(encoding)
+    except UnicodeDecodeError as error:
+        raise LuaBytecodeError(f"invalid {encoding} string: {error.reason} at byte {error.start}", address)
+
+def skip_bytes(stream: BytesIO, size: int):
+    address = stream.tell()
+    remaining = remaining_bytes(stream)
+    if size > remaining:
+        raise LuaBytecodeError(f"unexpected end of file, cannot skip {size} bytes with {remaining} left", address)
+    stream.seek(size, 1)
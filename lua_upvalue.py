@@ -1,4 +1,6 @@
 from io import BytesIO
+from lua_reader import read_bytes, read_string
+from lua_writer import write_string
 
 class LuaUpvalue:
     def __init__(self):
@@ -8,10 +10,13 @@ class LuaUpvalue:
         sizeTSize = sizes[1].value
         upvalue = LuaUpvalue()
 
-        size = int.from_bytes(stream.read(sizeTSize), byteorder=byteorder)
-        upvalue.name = stream.read(size).decode('utf-8')
+        size = int.from_bytes(read_bytes(stream, sizeTSize), byteorder=byteorder)
+        upvalue.name = read_string(stream, size, 'utf-8')
 
         return upvalue
 
+    def write(self, byteorder, sizes, stream: BytesIO):
+        write_string(byteorder, stream, self.name.encode('utf-8'), sizes[1].value)
+
     def __str__(self):
         return f"Upvalue: {self.name}"
\ No newline at end of file
@@ -0,0 +1,148 @@
+from enum import Enum, auto
+
+from lua_instruction import LuaOpcode, LuaRegisterName
+
+class OperandMode(Enum):
+    NONE = auto()       # unused, or a plain number/flag
+    REGISTER = auto()   # R(x), must be below maxStackSize
+    CONSTANT = auto()   # Kst(x), must be inside the constant pool
+    RK = auto()         # R(x) or Kst(x - 256)
+    UPVALUE = auto()    # UpValue[x]
+    JUMP = auto()       # pc + 1 + sBx must land inside the code
+    PROTOTYPE = auto()  # KPROTO[x]
+
+N, R, K, RK, U, J, P = OperandMode.NONE, OperandMode.REGISTER, OperandMode.CONSTANT, OperandMode.RK, OperandMode.UPVALUE, OperandMode.JUMP, OperandMode.PROTOTYPE
+
+# operand modes per opcode, following lopcodes.c of Lua 5.1: (A, B, C, Bx, sBx)
+OperandModeLookup = {
+    LuaOpcode.MOVE: (R, R, N, N, N),
+    LuaOpcode.LOADK: (R, N, N, K, N),
+    LuaOpcode.LOADBOOL: (R, N, N, N, N),
+    LuaOpcode.LOADNIL: (R, R, N, N, N),
+    LuaOpcode.GETUPVAL: (R, U, N, N, N),
+
+    LuaOpcode.GETGLOBAL: (R, N, N, K, N),
+    LuaOpcode.GETTABLE: (R, R, RK, N, N),
+
+    LuaOpcode.SETGLOBAL: (R, N, N, K, N),
+    LuaOpcode.SETUPVAL: (R, U, N, N, N),
+    LuaOpcode.SETTABLE: (R, RK, RK, N, N),
+
+    LuaOpcode.NEWTABLE: (R, N, N, N, N),
+
+    LuaOpcode.SELF: (R, R, RK, N, N),
+
+    LuaOpcode.ADD: (R, RK, RK, N, N),
+    LuaOpcode.SUB: (R, RK, RK, N, N),
+    LuaOpcode.MUL: (R, RK, RK, N, N),
+    LuaOpcode.DIV: (R, RK, RK, N, N),
+    LuaOpcode.MOD: (R, RK, RK, N, N),
+    LuaOpcode.POW: (R, RK, RK, N, N),
+    LuaOpcode.UNM: (R, R, N, N, N),
+    LuaOpcode.NOT: (R, R, N, N, N),
+    LuaOpcode.LEN: (R, R, N, N, N),
+
+    LuaOpcode.CONCAT: (R, R, R, N, N),
+
+    LuaOpcode.JMP: (N, N, N, N, J),
+
+    LuaOpcode.EQ: (N, RK, RK, N, N),
+    LuaOpcode.LT: (N, RK, RK, N, N),
+    LuaOpcode.LE: (N, RK, RK, N, N),
+
+    LuaOpcode.TEST: (R, N, N, N, N),
+    LuaOpcode.TESTSET: (R, R, N, N, N),
+
+    LuaOpcode.CALL: (R, N, N, N, N),
+    LuaOpcode.TAILCALL: (R, N, N, N, N),
+    LuaOpcode.RETURN: (R, N, N, N, N),
+
+    LuaOpcode.FORLOOP: (R, N, N, N, J),
+    LuaOpcode.FORPREP: (R, N, N, N, J),
+
+    LuaOpcode.TFORLOOP: (R, N, N, N, N),
+    LuaOpcode.SETLIST: (R, N, N, N, N),
+
+    LuaOpcode.CLOSE: (R, N, N, N, N),
+    LuaOpcode.CLOSURE: (R, N, N, P, N),
+
+    LuaOpcode.VARARG: (R, N, N, N, N)
+}
+
+OperandNames = [LuaRegisterName.A, LuaRegisterName.B, LuaRegisterName.C, LuaRegisterName.Bx, LuaRegisterName.sBx]
+
+class LuaViolation:
+    # the instruction is kept as a pc, so the address follows the function when a reload moves it
+    def __init__(self, function, pc, message):
+        self.function = function
+        self.pc = pc
+        self.message = message
+
+    @property
+    def address(self):
+        return self.function.value.instructions[self.pc].address
+
+    def __str__(self):
+        return f"{hex(self.address)}: {self.message}"
+
+def verify_chunk(data):
+    chunk = data.value
+    violations = []
+
+    # every bound is computed once per chunk so the per-instruction work is a table lookup and a compare
+    limits = {
+        R: chunk.maxStackSize,
+        K: len(chunk.constants),
+        U: chunk.numUpvalues,
+        J: len(chunk.instructions),
+        P: len(chunk.chunks)
+    }
+    kinds = {R: 'register', K: 'constant', U: 'upvalue', J: 'jump target', P: 'prototype'}
+
+    skip = False
+    for pc, instruction in enumerate(chunk.instructions):
+        if skip:
+            # the word after SETLIST with C == 0 is the raw block number, not an instruction
+            skip = False
+            continue
+
+        registers = instruction.value.registers
+        opcode = instruction.value.opcode
+        for name, mode in zip(OperandNames, OperandModeLookup[opcode]):
+            if mode is N:
+                continue
+            value = registers[name].value
+            if value is None:
+                continue
+
+            if mode is RK:
+                mode, value = (K, value - 256) if value >= 256 else (R, value)
+            elif mode is J:
+                value = pc + 1 + value
+
+            if value < 0 or value >= limits[mode]:
+                violations.append(LuaViolation(
+                    data, pc,
+                    f"{opcode} {name.name} {kinds[mode]} {value} out of range (limit {limits[mode]})"
+                ))
+
+        # the words an instruction takes as operands have to be there, code reading them relies on it
+        words = 0
+        if opcode == LuaOpcode.SETLIST and registers[LuaRegisterName.C].value == 0:
+            skip = True
+            words = 1
+        elif opcode == LuaOpcode.CLOSURE and 0 <= registers[LuaRegisterName.Bx].value < len(chunk.chunks):
+            words = chunk.chunks[registers[LuaRegisterName.Bx].value].numUpvalues
+        if pc + words >= len(chunk.instructions):
+            violations.append(LuaViolation(
+                data, pc,
+                f"{opcode} needs {words} operand word(s) after it, only {len(chunk.instructions) - pc - 1} left"
+            ))
+
+    return violations
+
+def verify(bytecode):
+    violations = []
+    for data in bytecode.chunks:
+        violations.extend(verify_chunk(data))
+    return violations
@@ -0,0 +1,8 @@
+from io import BytesIO
+
+def write_int(byteorder, stream: BytesIO, value: int, size: int):
+    stream.write(value.to_bytes(size, byteorder=byteorder, signed=False))
+
+def write_string(byteorder, stream: BytesIO, raw: bytes, sizeTSize: int):
+    write_int(byteorder, stream, len(raw), sizeTSize)
+    stream.write(raw)
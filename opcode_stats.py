@@ -0,0 +1,160 @@
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+import argparse
+import csv
+import json
+import os
+import sys
+
+from lua_chunk import LuaChunk
+from lua_instruction import LuaOpcode
+from parallel_reader import open_mapped
+from working_data import WorkingData
+
+# bins of every histogram, the operand fields are histogrammed raw regardless of the opcode's format
+HistogramSizes = {
+    'opcodes': 64,
+    'A': 256,
+    'B': 512,
+    'C': 512,
+    'function_sizes': 33
+}
+
+def empty_stats():
+    stats = {name: [0] * size for name, size in HistogramSizes.items()}
+    stats['files'] = 0
+    stats['functions'] = 0
+    stats['instructions'] = 0
+    return stats
+
+def merge_stats(stats, other):
+    for name in HistogramSizes:
+        stats[name] = [a + b for a, b in zip(stats[name], other[name])]
+    for name in ['files', 'functions', 'instructions']:
+        stats[name] += other[name]
+    return stats
+
+def code_ranges(stream):
+    # header fields are read directly, the stats path never materializes WorkingData for them
+    byteorder = 'big' if stream[6] == 0 else 'little'
+    sizes = [WorkingData.from_data(None, None, size, register=False) for size in stream[7:11]]
+    stream.seek(12)
+    prototypes = LuaChunk.scan(byteorder, sizes, stream).flatten()
+    return byteorder, stream[9], [(prototype.codeStart, prototype.numInstructions) for prototype in prototypes]
+
+def file_stats(path):
+    stats = empty_stats()
+    stream = open_mapped(path)
+    try:
+        byteorder, instructionSize, ranges = code_ranges(stream)
+        stats['files'] = 1
+        stats['functions'] = len(ranges)
+        stats['instructions'] = sum(count for start, count in ranges)
+
+        for start, count in ranges:
+            stats['function_sizes'][count.bit_length()] += 1
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        if numpy is not None:
+            dtype = numpy.dtype(f"{'<' if byteorder == 'little' else '>'}u{instructionSize}")
+            words = [numpy.frombuffer(stream, dtype=dtype, count=count, offset=start) for start, count in ranges if count > 0]
+            words = numpy.concatenate(words) if len(words) > 0 else numpy.zeros(0, dtype=dtype)
+            stats['opcodes'] = numpy.bincount(words & 0x3F, minlength=64).tolist()
+            stats['A'] = numpy.bincount((words >> 6) & 0xFF, minlength=256).tolist()
+            stats['B'] = numpy.bincount((words >> 23) & 0x1FF, minlength=512).tolist()
+            stats['C'] = numpy.bincount((words >> 14) & 0x1FF, minlength=512).tolist()
+            del words
+        else:
+            words = array('I' if instructionSize == 4 else 'Q')
+            words.frombytes(b''.join(stream[start:start + count * instructionSize] for start, count in ranges))
+            if byteorder != sys.byteorder:
+                words.byteswap()
+            opcodes, A, B, C = stats['opcodes'], stats['A'], stats['B'], stats['C']
+            for word in words:
+                opcodes[word & 0x3F] += 1
+                A[(word >> 6) & 0xFF] += 1
+                B[(word >> 23) & 0x1FF] += 1
+                C[(word >> 14) & 0x1FF] += 1
+
+        return stats
+    finally:
+        stream.close()
+
+def files_stats(paths):
+    stats = empty_stats()
+    for path in paths:
+        merge_stats(stats, file_stats(path))
+    return stats
+
+def corpus_stats(paths, workers=None):
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return files_stats(paths)
+
+    # every worker histograms its share of the corpus, the partial histograms are summed here
+    stats = empty_stats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for partial in pool.map(files_stats, [paths[i::workers] for i in range(workers)]):
+            merge_stats(stats, partial)
+    return stats
+
+def opcode_name(opcode):
+    try:
+        return str(LuaOpcode(opcode))
+    except ValueError:
+        return f"INVALID_{opcode}"
+
+def size_bucket(bucket):
+    if bucket == 0:
+        return "0"
+    return f"{1 << (bucket - 1)}-{(1 << bucket) - 1}"
+
+def report(stats):
+    # histograms keyed by readable labels, empty bins are dropped
+    return {
+        'files': stats['files'],
+        'functions': stats['functions'],
+        'instructions': stats['instructions'],
+        'opcodes': {opcode_name(i): count for i, count in enumerate(stats['opcodes']) if count > 0},
+        'operands': {name: {str(i): count for i, count in enumerate(stats[name]) if count > 0} for name in ['A', 'B', 'C']},
+        'function_sizes': {size_bucket(i): count for i, count in enumerate(stats['function_sizes']) if count > 0}
+    }
+
+def write_json(stats, file):
+    json.dump(report(stats), file, indent=4)
+
+def write_csv(stats, file):
+    data = report(stats)
+    writer = csv.writer(file)
+    writer.writerow(['histogram', 'bin', 'count'])
+    for name in ['files', 'functions', 'instructions']:
+        writer.writerow(['total', name, data[name]])
+    for opcode, count in data['opcodes'].items():
+        writer.writerow(['opcodes', opcode, count])
+    for operand, histogram in data['operands'].items():
+        for value, count in histogram.items():
+            writer.writerow([operand, value, count])
+    for bucket, count in data['function_sizes'].items():
+        writer.writerow(['function_sizes', bucket, count])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='Compiled Lua files to gather statistics over.')
+    parser.add_argument('-f', '--format', choices=['json', 'csv'], default='json', help='Output format.')
+    parser.add_argument('-o', '--output', default=None, help='Output file, stdout by default.')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Number of worker processes.')
+
+    args = parser.parse_args()
+    stats = corpus_stats(args.files, args.workers)
+
+    output = open(args.output, 'w', newline='') if args.output is not None else sys.stdout
+    if args.format == 'json':
+        write_json(stats, output)
+    else:
+        write_csv(stats, output)
+    if args.output is not None:
+        output.close()
@@ -0,0 +1,237 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import time
+
+from control_flow import JumpOpcodes, instruction_pcs, jump_target, operand_words, successors
+from lua_bytecode import LuaBytecode
+from lua_instruction import LuaOpcode, LuaRegisterName, isRK
+from lua_reader import LuaBytecodeError
+from lua_verifier import OperandMode, OperandModeLookup, OperandNames, verify
+
+sBx = LuaRegisterName.sBx
+
+def thread_jumps(chunk, byteorder):
+    # JMP to a JMP goes straight to the final target
+    threaded = 0
+    instructions = chunk.instructions
+    for pc in instruction_pcs(chunk):
+        instruction = instructions[pc].value
+        if instruction.opcode != LuaOpcode.JMP:
+            continue
+
+        target, seen = jump_target(instruction, pc), {pc}
+        while instructions[target].value.opcode == LuaOpcode.JMP and target not in seen:
+            seen.add(target)
+            target = jump_target(instructions[target].value, target)
+        if target in seen:
+            # a jump cycle, leave it alone
+            continue
+
+        if target != jump_target(instruction, pc):
+            instruction.registers[sBx].value = target - pc - 1
+            threaded += 1
+    return threaded
+
+def remove_dead_code(chunk, byteorder):
+    # drops instructions no path from the entry reaches, such as code after an unconditional RETURN or JMP
+    count = len(chunk.instructions)
+    reachable = [False] * count
+    stack = [0]
+    while len(stack) > 0:
+        pc = stack.pop()
+        if pc >= count or reachable[pc]:
+            continue
+        reachable[pc] = True
+        for word in range(operand_words(chunk, pc)):
+            reachable[pc + 1 + word] = True
+        stack.extend(successors(chunk, pc))
+
+    # every function has to end in a RETURN
+    reachable[count - 1] = True
+    removed = reachable.count(False)
+    if removed == 0:
+        return 0
+
+    # position[pc] is the new pc of the first kept instruction at or after pc
+    position = [0] * (count + 1)
+    for pc in range(count):
+        position[pc + 1] = position[pc] + (1 if reachable[pc] else 0)
+
+    for pc in instruction_pcs(chunk):
+        instruction = chunk.instructions[pc].value
+        if reachable[pc] and instruction.opcode in JumpOpcodes:
+            instruction.registers[sBx].value = position[jump_target(instruction, pc)] - position[pc] - 1
+
+    chunk.instructions = [instruction for pc, instruction in enumerate(chunk.instructions) if reachable[pc]]
+    if len(chunk.debug['lines']) == count:
+        chunk.debug['lines'] = [line for pc, line in enumerate(chunk.debug['lines']) if reachable[pc]]
+
+    # local scopes are pc ranges kept as raw ints
+    for local in chunk.debug['locals']:
+        local = local.value
+        for field in ['start', 'end']:
+            raw = getattr(local, field)
+            pc = min(int.from_bytes(raw, byteorder=byteorder), count)
+            setattr(local, field, position[pc].to_bytes(len(raw), byteorder=byteorder))
+    return removed
+
+def constant_operands(chunk):
+    # every operand referring to the constant pool, as (registers, name, mode, index)
+    for pc in instruction_pcs(chunk):
+        instruction = chunk.instructions[pc].value
+        for name, mode in zip(OperandNames, OperandModeLookup[instruction.opcode]):
+            value = instruction.registers[name].value
+            if mode == OperandMode.CONSTANT:
+                yield instruction.registers, name, mode, value
+            elif mode == OperandMode.RK and isRK(value):
+                yield instruction.registers, name, mode, value - 256
+
+def remap_constants(chunk, remap):
+    # Kst operands such as the Bx of LOADK hold the index itself, only RK operands are offset by 256
+    for registers, name, mode, index in list(constant_operands(chunk)):
+        registers[name].value = remap[index] + (256 if mode == OperandMode.RK else 0)
+
+def merge_constants(chunk, byteorder):
+    # equal constants are referenced through their first occurrence, the copies are left for pruning
+    first = {}
+    remap = []
+    for index, constant in enumerate(chunk.constants):
+        remap.append(first.setdefault(constant.value.key(), index))
+    merged = len(chunk.constants) - len(first)
+    if merged > 0:
+        remap_constants(chunk, remap)
+    return merged
+
+def prune_constants(chunk, byteorder):
+    used = set(index for registers, name, mode, index in constant_operands(chunk))
+    if len(used) == len(chunk.constants):
+        return 0
+
+    remap = [None] * len(chunk.constants)
+    constants = []
+    for index, constant in enumerate(chunk.constants):
+        if index in used:
+            remap[index] = len(constants)
+            constants.append(constant)
+
+    pruned = len(chunk.constants) - len(constants)
+    remap_constants(chunk, remap)
+    chunk.constants = constants
+    return pruned
+
+def strip_debug(chunk, byteorder):
+    stripped = len(chunk.debug['lines']) + len(chunk.debug['locals']) + len(chunk.debug['upvalues']) + (1 if chunk.source else 0)
+    chunk.source = ''
+    chunk.debug = {
+        'lines': [],
+        'locals': [],
+        'upvalues': []
+    }
+    return stripped
+
+Passes = {
+    'thread-jumps': thread_jumps,
+    'dead-code': remove_dead_code,
+    'merge-constants': merge_constants,
+    'prune-constants': prune_constants,
+    'strip-debug': strip_debug
+}
+
+# jumps are threaded first so the jumps they bypass become dead, merged duplicates are then pruned
+DefaultPasses = ['thread-jumps', 'dead-code', 'merge-constants', 'prune-constants']
+
+class PassReport:
+    def __init__(self, name, changes, saved, elapsed):
+        self.name = name
+        self.changes = changes
+        self.saved = saved
+        self.elapsed = elapsed
+
+def optimize(bytecode, passes=DefaultPasses):
+    # rewrites the chunk tree in place, returns a PassReport per pass with the bytes it saved
+    violations = verify(bytecode)
+    if len(violations) > 0:
+        raise LuaBytecodeError(f"refusing to optimize bytecode with verification issues: {violations[0].message}", violations[0].address)
+
+    byteorder = bytecode.byteorder()
+    reports = []
+    size = bytecode.size()
+    for name in passes:
+        start = time.perf_counter()
+        changes = sum(Passes[name](function.value, byteorder) for function in bytecode.chunks)
+        elapsed = time.perf_counter() - start
+
+        optimizedSize = bytecode.size()
+        reports.append(PassReport(name, changes, size - optimizedSize, elapsed))
+        size = optimizedSize
+
+    for function in bytecode.chunks:
+        function.value.revision += 1
+    return reports
+
+def verify_output(data):
+    # the serialized output has to read back and verify cleanly, nothing it creates is kept registered
+    bytecode = LuaBytecode.read(data, register=False)
+    violations = verify(bytecode)
+    if len(violations) > 0:
+        raise LuaBytecodeError(f"optimized output does not verify: {violations[0].message}", violations[0].address)
+    for function in bytecode.chunks:
+        instructions = function.value.instructions
+        if len(instructions) == 0 or instructions[-1].value.opcode != LuaOpcode.RETURN:
+            raise LuaBytecodeError("optimized function does not end in RETURN", function.address)
+
+def optimize_file(path, output, passes=DefaultPasses):
+    with open(path, 'rb') as file:
+        data = file.read()
+    bytecode = LuaBytecode.read(data, register=False)
+    reports = optimize(bytecode, passes)
+    optimized = bytecode.write()
+
+    verify_output(optimized)
+    with open(output, 'wb') as file:
+        file.write(optimized)
+    return len(data), len(optimized), reports
+
+def optimize_files(paths, outputs, passes=DefaultPasses, workers=None):
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return [optimize_file(path, output, passes) for path, output in zip(paths, outputs)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(optimize_file, paths, outputs, [passes] * len(paths)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='Compiled Lua files to optimize.')
+    parser.add_argument('-o', '--output', required=True, help='Directory the optimized files are written to.')
+    parser.add_argument('-p', '--passes', default=','.join(DefaultPasses), help=f"Comma separated passes to run, from {', '.join(Passes)}.")
+    parser.add_argument('-s', '--strip', action='store_true', help='Also strip debug information.')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Number of worker processes.')
+
+    args = parser.parse_args()
+    passes = [name for name in args.passes.split(',') if name != '']
+    for name in passes:
+        if name not in Passes:
+            parser.error(f"unknown pass '{name}'")
+    if args.strip and 'strip-debug' not in passes:
+        passes.append('strip-debug')
+
+    os.makedirs(args.output, exist_ok=True)
+    outputs = [os.path.join(args.output, os.path.basename(path)) for path in args.files]
+
+    start = time.perf_counter()
+    results = optimize_files(args.files, outputs, passes, args.workers)
+    elapsed = time.perf_counter() - start
+
+    totalIn = sum(result[0] for result in results)
+    totalOut = sum(result[1] for result in results)
+    print("{:<18} {:>10} {:>12} {:>10}".format('pass', 'changes', 'saved bytes', 'ms'))
+    for i, name in enumerate(passes):
+        print("{:<18} {:>10} {:>12} {:>10.2f}".format(
+            name,
+            sum(result[2][i].changes for result in results),
+            sum(result[2][i].saved for result in results),
+            sum(result[2][i].elapsed for result in results) * 1000
+        ))
+    print(f"{len(results)} file(s), {totalIn} -> {totalOut} bytes ({(totalIn - totalOut) / max(totalIn, 1):.1%} smaller) in {elapsed * 1000:.0f} ms")
@@ -1,5 +1,4 @@
 from enum import Enum, auto
-from termcolor import colored
 
 class OutputType(Enum):
     ADDRESS = auto()
@@ -15,14 +14,34 @@ class OutputType(Enum):
     ERROR = auto()
     WARNING = auto()
 
+    TITLE = auto()
+    PROMPT = auto()
+
     DEFAULT = auto()
 
     END_OF_LINE = auto()
 
+OutputColors = {
+    OutputType.ADDRESS: 'light_magenta',
+    OutputType.KEYWORD: 'green',
+    OutputType.INSTRUCTION: 'light_grey',
+    OutputType.REGISTER: 'light_cyan',
+    OutputType.CONSTANTTYPE: 'light_red',
+    OutputType.CONSTANT: 'light_green',
+    OutputType.NUMBER: 'light_blue',
+    OutputType.TAG: 'yellow',
+    OutputType.ERROR: 'light_red',
+    OutputType.WARNING: 'light_yellow',
+    OutputType.TITLE: 'light_blue',
+    OutputType.PROMPT: 'grey',
+    OutputType.DEFAULT: 'white'
+}
+
 class OutputSystem:
     def __init__(self):
         self.prepared_data = []
         self.loaded_format = None
+        self.colored = True
 
     def add_data(self, data, type = OutputType.DEFAULT):
         self.prepared_data.append((data, type))
@@ -34,43 +53,34 @@ class OutputSystem:
         self.loaded_format = format
 
     def color_from_type(self, data, type):
-        if type == OutputType.ADDRESS:
-            return colored(data, 'light_magenta')
-        elif type == OutputType.KEYWORD:
-            return colored(data, 'green')
-        elif type == OutputType.INSTRUCTION:
-            return colored(data, 'light_grey')
-        elif type == OutputType.REGISTER:
-            return colored(data, 'light_cyan')
-        elif type == OutputType.CONSTANTTYPE:
-            return colored(data, 'light_red')
-        elif type == OutputType.CONSTANT:
-            return colored(data, 'light_green')
-        elif type == OutputType.NUMBER:
-            return colored(data, 'light_blue')
-        elif type == OutputType.TAG:
-            return colored(data, 'yellow')
-        elif type == OutputType.ERROR:
-            return colored(data, 'light_red')
-        elif type == OutputType.WARNING:
-            return colored(data, 'light_yellow')
-        elif type == OutputType.DEFAULT:
-            return colored(data, 'white')
+        if not self.colored:
+            return str(data)
+        if type not in OutputColors:
+            return None
+        # termcolor is only imported once colored output is actually produced
+        from termcolor import colored
+        return colored(data, OutputColors[type])
         
     def end_of_line(self):
         self.prepared_data.append((None, OutputType.END_OF_LINE))
 
-    def print_data(self):
+    def render_data(self):
+        lines = []
         printing_data = []
         line = self.loaded_format if self.loaded_format is not None else ''
         for data, type in self.prepared_data:
             if type == OutputType.END_OF_LINE:
                 if self.loaded_format is not None:
-                    print(line.format(*printing_data))
+                    lines.append(line.format(*printing_data))
                     printing_data = []
                 else:
-                    print(*printing_data)
+                    lines.append(' '.join(printing_data))
                     printing_data = []
             else:
                 printing_data.append(self.color_from_type(data, type))
-        self.prepared_data = []
\ No newline at end of file
+        self.prepared_data = []
+        return lines
+
+    def print_data(self):
+        for line in self.render_data():
+            print(line)
\ No newline at end of file
@@ -0,0 +1,125 @@
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import mmap
+import os
+import sys
+
+from lua_bytecode import LuaBytecode
+from lua_chunk import LuaChunk
+from lua_constant import LuaStringTable
+from lua_verifier import LuaViolation, verify, verify_chunk
+from snapshot import LazySequence, SnapshotBytecode, write_prototypes
+from working_data import WorkingData, WorkingType
+
+# below this size the process pool costs more than it saves
+PARALLEL_THRESHOLD = 4 * 1024 * 1024
+
+def open_mapped(path):
+    with open(path, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def decode_prototypes(path, byteorder, sizes, prototypes, check):
+    # prototypes are (start, debug start, child indexes in the whole file, child upvalue counts). The batch goes back as a snapshot,
+    # flat arrays pickle far faster than the object graph and the parent only decodes what it looks at.
+    # Verifying here while the chunks are decoded spares the parent from decoding everything for it,
+    # violations go back as (index in the batch, pc, message)
+    stream = open_mapped(path)
+    strings = LuaStringTable()
+    chunks = []
+    violations = []
+    try:
+        for index, (start, debugStart, children, childUpvalues) in enumerate(prototypes):
+            stream.seek(start)
+            chunk = LuaChunk.read(byteorder, sizes, stream, debugStart, strings, register=False)
+            if check:
+                # the children were skipped, verify_chunk only needs their count and upvalue counts
+                chunk.chunks = [LuaChunk() for numUpvalues in childUpvalues]
+                for child, numUpvalues in zip(chunk.chunks, childUpvalues):
+                    child.numUpvalues = numUpvalues
+                for violation in verify_chunk(WorkingData.from_data(WorkingType.FUNCTION, start, chunk, register=False)):
+                    violations.append((index, violation.pc, violation.message))
+            chunks.append(chunk)
+        luaHeader = stream[:12]
+    finally:
+        stream.close()
+
+    output = BytesIO()
+    write_prototypes(luaHeader, chunks, [prototype[2] for prototype in prototypes], output)
+    return output.getvalue(), violations
+
+def split_batches(ranges, count):
+    # contiguous batches of roughly equal byte size, keeping the DFS order intact
+    total = sum(prototypeRange.own_size() for prototypeRange in ranges)
+    target = max(1, total // count)
+    indexes = {id(prototypeRange): index for index, prototypeRange in enumerate(ranges)}
+
+    batches, batch, batchSize = [], [], 0
+    for prototypeRange in ranges:
+        batch.append((prototypeRange.start, prototypeRange.debugStart, [indexes[id(child)] for child in prototypeRange.chunks],
+                      [child.numUpvalues for child in prototypeRange.chunks]))
+        batchSize += prototypeRange.own_size()
+        if batchSize >= target:
+            batches.append(batch)
+            batch, batchSize = [], 0
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+def read_serial(path, violations):
+    with open(path, 'rb') as file:
+        bytecode = LuaBytecode.read(file.read(), register=False)
+    if violations is not None:
+        violations.extend(verify(bytecode))
+    return bytecode
+
+def read_parallel(path, workers=None, violations=None):
+    # the tree is made of snapshot views over the workers' arrays and, like a snapshot, nothing of it
+    # registers with WorkingDataObjects. Pass a list as violations to verify the file while reading it
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or os.path.getsize(path) < PARALLEL_THRESHOLD:
+        return read_serial(path, violations)
+
+    bytecode = LuaBytecode()
+    bytecode.strings = LuaStringTable()
+    stream = open_mapped(path)
+    byteorder = bytecode.read_header(stream, register=False)
+    if bytecode.instructionSize.value != 4 or sys.byteorder != 'little':
+        # snapshots hold 4 byte instructions and are only mapped on little-endian hosts
+        stream.close()
+        return read_serial(path, violations)
+    sizes = bytecode.sizes()
+
+    # phase one: locate every prototype from the size fields alone
+    mainRange = LuaChunk.scan(byteorder, sizes, stream)
+    stream.close()
+    ranges = mainRange.flatten()
+
+    # phase two: decode the prototypes in the pool, several batches per worker to even out the load
+    batches = split_batches(ranges, workers * 4)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(decode_prototypes, path, byteorder, sizes, batch, violations is not None) for batch in batches]
+        results = [future.result() for future in futures]
+    parts = [SnapshotBytecode(data) for data, found in results]
+
+    # the parts hold consecutive runs of the DFS order, children point into the whole file, so every part
+    # resolves them through the file's function entries. Strings are interned into the file's table on access
+    starts, start = [], 0
+    for batch in batches:
+        starts.append(start)
+        start += len(batch)
+
+    def function(index):
+        part = bisect_right(starts, index) - 1
+        return parts[part].function(index - starts[part])
+
+    bytecode.chunks = LazySequence(len(ranges), function)
+    for part in parts:
+        part.chunks = bytecode.chunks
+        part.strings = bytecode.strings
+
+    if violations is not None:
+        for start, (data, found) in zip(starts, results):
+            violations.extend(LuaViolation(bytecode.chunks[start + index], pc, message) for index, pc, message in found)
+
+    return bytecode
@@ -0,0 +1,258 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import re
+
+from lua_bytecode import iter_prototypes
+from lua_instruction import LuaOpcode, LuaRegisterName, isRK
+from lua_verifier import OperandMode, OperandModeLookup
+from working_data import WorkingData, WorkingType
+
+# a term is an opcode, alternatives joined by '|' or '*' for any opcode, optionally followed by
+# constraints such as GETGLOBAL[K="loadstring"] or CALL[B=2, C=1]
+TermExpression = re.compile(r'\s*([A-Z*|]+)\s*(\[(?:"(?:[^"\\]|\\.)*"|[^\]"])*\])?\s*(;|$)')
+ConstraintExpression = re.compile(r'\s*(A|B|C|Bx|sBx|K)\s*=\s*("(?:[^"\\]|\\.)*"|[^,\]]+?)\s*(,|\]$)')
+
+ConstraintRegisters = {
+    'A': LuaRegisterName.A,
+    'B': LuaRegisterName.B,
+    'C': LuaRegisterName.C,
+    'Bx': LuaRegisterName.Bx,
+    'sBx': LuaRegisterName.sBx
+}
+
+class PatternError(Exception):
+    pass
+
+class PatternTerm:
+    def __init__(self):
+        self.opcodes = []
+        self.constraints = []
+
+    def parse(source):
+        term = PatternTerm()
+        match = TermExpression.fullmatch(source)
+        if match is None:
+            raise PatternError(f"invalid term '{source.strip()}'")
+
+        for name in match.group(1).split('|'):
+            if name == '*':
+                term.opcodes.extend(LuaOpcode)
+            elif name in LuaOpcode.__members__:
+                term.opcodes.append(LuaOpcode[name])
+            else:
+                raise PatternError(f"unknown opcode '{name}'")
+        term.opcodes = list(dict.fromkeys(term.opcodes))
+
+        if match.group(2) is not None:
+            body = match.group(2)[1:]
+            position = 0
+            while position < len(body):
+                constraint = ConstraintExpression.match(body, position)
+                if constraint is None:
+                    raise PatternError(f"invalid constraint '{body[position:-1].strip()}'")
+                term.constraints.append((constraint.group(1), parse_value(constraint.group(2))))
+                position = constraint.end()
+
+        return term
+
+    def matches(self, instruction):
+        if instruction.opcode not in self.opcodes:
+            return False
+        for name, value in self.constraints:
+            if name == 'K':
+                if value not in [constant.value.text() for constant in instruction_constants(instruction)]:
+                    return False
+            elif instruction.registers[ConstraintRegisters[name]].value != value:
+                return False
+        return True
+
+class Pattern:
+    def __init__(self):
+        self.name = None
+        self.source = None
+        self.terms = []
+
+    def parse(name, source):
+        pattern = Pattern()
+        pattern.name = name
+        pattern.source = source
+
+        position = 0
+        while position < len(source):
+            match = TermExpression.match(source, position)
+            if match is None or match.end() == position:
+                raise PatternError(f"invalid pattern '{source}' at offset {position}")
+            pattern.terms.append(PatternTerm.parse(match.group(0).rstrip().rstrip(';')))
+            position = match.end()
+
+        if len(pattern.terms) == 0:
+            raise PatternError("empty pattern")
+        return pattern
+
+    def anchor(self):
+        # (index of the first term, opcode sequences) to look for: the longest run of single opcode terms, or
+        # the alternatives of the narrowest term when there is none. Expanding every term instead would
+        # multiply the alternatives, the other terms are checked at each place the anchor is found
+        best, start = None, None
+        for i, term in enumerate(self.terms + [None]):
+            if term is not None and len(term.opcodes) == 1:
+                start = i if start is None else start
+            elif start is not None:
+                if best is None or i - start > best[1] - best[0]:
+                    best = (start, i)
+                start = None
+
+        if best is not None:
+            return best[0], [[term.opcodes[0] for term in self.terms[best[0]:best[1]]]]
+        narrowest = min(range(len(self.terms)), key=lambda i: len(self.terms[i].opcodes))
+        return narrowest, [[opcode] for opcode in self.terms[narrowest].opcodes]
+
+class PatternMatch:
+    def __init__(self, pattern, function, pc):
+        self.pattern = pattern
+        self.function = function
+        self.pc = pc
+
+    def address(self):
+        return self.function.value.instructions[self.pc].address
+
+def parse_value(text):
+    if text.startswith('"'):
+        return re.sub(r'\\(.)', r'\1', text[1:-1])
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise PatternError(f"invalid value '{text}'")
+
+def instruction_constants(instruction):
+    # constants referenced through Kst(x) or RK(x) operands
+    chunk = instruction.chunk
+    constants = []
+    for mode, register in zip(OperandModeLookup[instruction.opcode], instruction.registers.values()):
+        index = None
+        if mode == OperandMode.CONSTANT:
+            index = register.value
+        elif mode == OperandMode.RK and isRK(register.value):
+            index = register.value - 256
+        if index is not None and index < len(chunk.constants):
+            constants.append(chunk.constants[index])
+    return constants
+
+class PatternAutomaton:
+    # Aho-Corasick over opcode streams, the anchors of every pattern are found in one pass over a function's code
+    def __init__(self, patterns):
+        self.patterns = patterns
+
+        goto = [{}]
+        outputs = [[]]
+        for index, pattern in enumerate(patterns):
+            first, sequences = pattern.anchor()
+            for sequence in sequences:
+                state = 0
+                for opcode in sequence:
+                    if opcode not in goto[state]:
+                        goto.append({})
+                        outputs.append([])
+                        goto[state][opcode] = len(goto) - 1
+                    state = goto[state][opcode]
+                # the term the anchor ends with, the pattern starts that many instructions earlier
+                outputs[state].append((index, first + len(sequence) - 1))
+
+        # breadth first to fill in failure links, then flatten into a dense transition table
+        failure = [0] * len(goto)
+        self.transitions = [0] * (len(goto) * 64)
+        for opcode, state in goto[0].items():
+            self.transitions[opcode] = state
+
+        queue = list(goto[0].values())
+        for state in queue:
+            outputs[state] = outputs[state] + outputs[failure[state]] if failure[state] != state else outputs[state]
+            for opcode in range(64):
+                nextState = goto[state].get(opcode)
+                if nextState is None:
+                    self.transitions[state * 64 + opcode] = self.transitions[failure[state] * 64 + opcode]
+                else:
+                    failure[nextState] = self.transitions[failure[state] * 64 + opcode]
+                    self.transitions[state * 64 + opcode] = nextState
+                    queue.append(nextState)
+
+        self.outputs = outputs
+
+    def search_chunk(self, function):
+        matches = []
+        instructions = function.value.instructions
+        transitions, outputs = self.transitions, self.outputs
+
+        state = 0
+        for pc, instruction in enumerate(instructions):
+            state = transitions[state * 64 + instruction.value.opcode]
+            # anchors match here, the whole pattern is only checked for these candidates
+            for index, offset in outputs[state]:
+                start = pc - offset
+                terms = self.patterns[index].terms
+                if start < 0 or start + len(terms) > len(instructions):
+                    continue
+                if all(term.matches(instructions[start + i].value) for i, term in enumerate(terms)):
+                    matches.append(PatternMatch(self.patterns[index], function, start))
+        return matches
+
+    def search(self, bytecode):
+        matches = []
+        for function in bytecode.chunks:
+            matches.extend(self.search_chunk(function))
+        return matches
+
+def parse_patterns(lines):
+    # one pattern per line, optionally named as 'name: pattern', lines starting with '#' are comments
+    patterns = []
+    for number, line in enumerate(lines):
+        line = line.strip()
+        if len(line) == 0 or line.startswith('#'):
+            continue
+        name, separator, source = line.partition(':')
+        if separator == '' or not re.fullmatch(r'[\w.-]+', name.strip()):
+            name, source = f"pattern{number + 1}", line
+        patterns.append(Pattern.parse(name.strip(), source.strip()))
+    return patterns
+
+def search_file(path, patterns):
+    # functions are streamed one at a time, so memory does not grow with the file
+    automaton = PatternAutomaton(patterns)
+    results = []
+    for prototypePath, chunk in iter_prototypes(path):
+        function = WorkingData.from_data(WorkingType.FUNCTION, chunk.__startAddress__, chunk, register=False)
+        results.extend((path, match.pattern.name, function.address, match.address()) for match in automaton.search_chunk(function))
+    return results
+
+def search_files(paths, patterns, workers=None):
+    # results are plain tuples (file, pattern name, function address, instruction address)
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return [result for path in paths for result in search_file(path, patterns)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for found in pool.map(search_file, paths, [patterns] * len(paths)):
+            results.extend(found)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='Compiled Lua files to search.')
+    parser.add_argument('-p', '--pattern', action='append', default=[], help='Pattern to search for, may be repeated.')
+    parser.add_argument('-f', '--patterns-file', default=None, help='File with one pattern per line.')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Number of worker processes.')
+
+    args = parser.parse_args()
+    lines = list(args.pattern)
+    if args.patterns_file is not None:
+        with open(args.patterns_file) as file:
+            lines.extend(file.read().splitlines())
+
+    for path, name, function, address in search_files(args.files, parse_patterns(lines), args.workers):
+        print(f"{path}:{hex(function)}:{hex(address)} {name}")
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+
+# bump when the layout of rendered lines changes
+RENDER_FORMAT_VERSION = 1
+
+class RenderCache:
+    def __init__(self, maxBytes=64 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def key(self, chunk, kind, colored):
+        return (chunk, chunk.revision, kind, colored, RENDER_FORMAT_VERSION)
+
+    def get(self, chunk, kind, colored):
+        key = self.key(chunk, kind, colored)
+        lines = self.entries.get(key)
+        if lines is not None:
+            self.entries.move_to_end(key)
+        return lines
+
+    def put(self, chunk, kind, colored, lines):
+        key = self.key(chunk, kind, colored)
+        if key in self.entries:
+            self.size -= self.entry_size(self.entries.pop(key))
+
+        size = self.entry_size(lines)
+        if size > self.maxBytes:
+            return
+        self.entries[key] = lines
+        self.size += size
+
+        while self.size > self.maxBytes:
+            key, evicted = self.entries.popitem(last=False)
+            self.size -= self.entry_size(evicted)
+
+    def entry_size(self, lines):
+        return sum(len(line) for line in lines)
+
+    def invalidate(self, chunk):
+        # entries of older revisions can never be hit again, drop them right away to free their bytes
+        chunk.revision += 1
+        for key in [key for key in self.entries if key[0] is chunk]:
+            self.size -= self.entry_size(self.entries.pop(key))
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
@@ -0,0 +1,300 @@
+from array import array
+from io import BytesIO
+import argparse
+import mmap
+import struct
+import sys
+
+from lua_bytecode import LuaBytecode
+from lua_chunk import LuaChunk
+from lua_constant import LuaConstant, LuaConstantType, LuaStringTable
+from lua_instruction import LuaInstruction
+from lua_local import LuaLocal
+from lua_reader import LuaBytecodeError
+from lua_upvalue import LuaUpvalue
+from working_data import WorkingData, WorkingType
+
+# Layout, all little-endian and every section aligned to 8 bytes:
+#   header      magic, format version, section count, the 12 byte Lua header, prototype count
+#   directory   (offset, length) of every section in Sections order
+#   sections    fixed size records and flat arrays indexed by the prototype table, strings live in one heap
+# Nothing is decoded when a snapshot is opened, elements are built from the arrays when first accessed.
+SNAPSHOT_MAGIC = b'LBSN'
+SNAPSHOT_VERSION = 1
+
+Header = struct.Struct('<4sHH12sI4x')
+DirectoryEntry = struct.Struct('<QQ')
+
+# address, code address, source offset, source length, line defined, last line defined, child start and count,
+# then start and count into the code, constant, line, local and upvalue name arrays, and the four byte sized fields
+Prototype = struct.Struct('<QQQIIIIIIIIIIIIIIIBBBB')
+
+# section name -> array typecode, None for raw bytes
+Sections = {
+    'prototypes': None,
+    'children': 'I',
+    'code': 'I',
+    'constant_types': 'B',
+    'constant_data': 'Q',
+    'constant_lengths': 'I',
+    'constant_addresses': 'Q',
+    'lines': None,
+    'local_names': 'Q',
+    'local_name_lengths': 'I',
+    'local_ranges': None,
+    'local_addresses': 'Q',
+    'upvalue_names': 'Q',
+    'upvalue_name_lengths': 'I',
+    'upvalue_addresses': 'Q',
+    'strings': None
+}
+
+def align(size):
+    return (size + 7) & ~7
+
+class StringHeap:
+    # raw strings written once each, referenced by offset
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+
+    def add(self, raw):
+        offset = self.offsets.get(raw)
+        if offset is None:
+            offset = len(self.data)
+            self.offsets[raw] = offset
+            self.data += raw
+        return offset
+
+def write_snapshot(bytecode, stream):
+    chunks = [function.value for function in bytecode.chunks]
+    indexes = {id(chunk): index for index, chunk in enumerate(chunks)}
+    luaHeader = bytecode.signature.value + bytes([
+        bytecode.version.value, bytecode.format.value, bytecode.endianness.value, bytecode.intSize.value,
+        bytecode.sizeTSize.value, bytecode.instructionSize.value, bytecode.numberSize.value, bytecode.integralFlag.value
+    ])
+    write_prototypes(luaHeader, chunks, [[indexes[id(child)] for child in chunk.chunks] for chunk in chunks], stream)
+
+def write_prototypes(luaHeader, chunks, children, stream):
+    # children holds the prototype table indexes of each chunk's children. A part of a file can be written
+    # with the indexes of the whole file, its children then point outside of the snapshot
+    if luaHeader[9] != 4:
+        raise LuaBytecodeError(f"snapshots need 4 byte instructions, not {luaHeader[9]}")
+
+    sections = {name: array(typecode) if typecode is not None else bytearray() for name, typecode in Sections.items()}
+    heap = StringHeap()
+
+    for chunk, childIndexes in zip(chunks, children):
+        source = chunk.source.encode('utf-8')
+        codeAddress = chunk.instructions[0].address if len(chunk.instructions) > 0 else 0
+        sections['prototypes'] += Prototype.pack(
+            chunk.__startAddress__, codeAddress, heap.add(source), len(source), chunk.lineDefined, chunk.lastLineDefined,
+            len(sections['children']), len(childIndexes),
+            len(sections['code']), len(chunk.instructions),
+            len(sections['constant_types']), len(chunk.constants),
+            len(sections['lines']) // 4, len(chunk.debug['lines']),
+            len(sections['local_addresses']), len(chunk.debug['locals']),
+            len(sections['upvalue_addresses']), len(chunk.debug['upvalues']),
+            chunk.numUpvalues, chunk.numParameters, chunk.isVararg, chunk.maxStackSize
+        )
+        sections['children'].extend(childIndexes)
+        sections['code'].extend(instruction.value.encode() for instruction in chunk.instructions)
+
+        for constant in chunk.constants:
+            value = constant.value
+            sections['constant_types'].append(value.type.value)
+            sections['constant_addresses'].append(constant.address)
+            if value.type == LuaConstantType.String:
+                sections['constant_data'].append(heap.add(value.string.raw))
+                sections['constant_lengths'].append(len(value.string.raw))
+            elif value.type == LuaConstantType.Number:
+                sections['constant_data'].append(struct.unpack('<Q', struct.pack('<d', value.literal))[0])
+                sections['constant_lengths'].append(0)
+            else:
+                sections['constant_data'].append(1 if value.literal else 0)
+                sections['constant_lengths'].append(0)
+
+        for line in chunk.debug['lines']:
+            sections['lines'] += line
+        for local in chunk.debug['locals']:
+            name = local.value.name.encode('ascii')
+            sections['local_names'].append(heap.add(name))
+            sections['local_name_lengths'].append(len(name))
+            sections['local_ranges'] += local.value.start + local.value.end
+            sections['local_addresses'].append(local.address)
+        for upvalue in chunk.debug['upvalues']:
+            name = upvalue.value.name.encode('utf-8')
+            sections['upvalue_names'].append(heap.add(name))
+            sections['upvalue_name_lengths'].append(len(name))
+            sections['upvalue_addresses'].append(upvalue.address)
+    sections['strings'] = heap.data
+
+    blobs = []
+    for name in Sections:
+        blob = sections[name]
+        if isinstance(blob, array):
+            if sys.byteorder != 'little':
+                blob.byteswap()
+            blob = blob.tobytes()
+        blobs.append(bytes(blob))
+
+    offset = align(Header.size + DirectoryEntry.size * len(Sections))
+    directory = []
+    for blob in blobs:
+        directory.append((offset, len(blob)))
+        offset = align(offset + len(blob))
+
+    stream.write(Header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(Sections), luaHeader, len(chunks)))
+    for entry in directory:
+        stream.write(DirectoryEntry.pack(*entry))
+    for (offset, length), blob in zip(directory, blobs):
+        stream.write(b'\x00' * (offset - stream.tell()))
+        stream.write(blob)
+
+def snapshot_bytes(bytecode):
+    stream = BytesIO()
+    write_snapshot(bytecode, stream)
+    return stream.getvalue()
+
+class LazySequence:
+    # a read-only list whose elements are built on first access and then kept
+    def __init__(self, count, factory):
+        self.items = [None] * count
+        self.factory = factory
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.items)))]
+        item = self.items[index]
+        if item is None:
+            item = self.factory(index if index >= 0 else index + len(self.items))
+            self.items[index] = item
+        return item
+
+    def __iter__(self):
+        for index in range(len(self.items)):
+            yield self[index]
+
+class SnapshotChunk(LuaChunk):
+    # a LuaChunk whose elements are views over the snapshot arrays
+    def __init__(self, snapshot, index):
+        super().__init__()
+        (address, codeAddress, sourceOffset, sourceLength, self.lineDefined, self.lastLineDefined,
+         childStart, numChildren, codeStart, numInstructions, constantStart, numConstants,
+         lineStart, numLines, localStart, numLocals, upvalueStart, numUpvalueNames,
+         self.numUpvalues, self.numParameters, self.isVararg, self.maxStackSize) = Prototype.unpack_from(snapshot.sections['prototypes'], index * Prototype.size)
+
+        self.__startAddress__ = address
+        self.source = snapshot.string(sourceOffset, sourceLength).decode('utf-8')
+        instructionSize = snapshot.instructionSize.value
+
+        def instruction(i):
+            instruction = LuaInstruction.decode(snapshot.sections['code'][codeStart + i], codeAddress + i * instructionSize)
+            instruction.chunk = self
+            return WorkingData.from_data(WorkingType.INSTRUCTION, codeAddress + i * instructionSize, instruction, register=False)
+
+        def child(i):
+            # through the function entries, so the child knows its entry as in a parsed file
+            return snapshot.chunks[snapshot.sections['children'][childStart + i]].value
+
+        def line(i):
+            return bytes(snapshot.sections['lines'][(lineStart + i) * 4:(lineStart + i + 1) * 4])
+
+        def local(i):
+            i += localStart
+            value = LuaLocal()
+            value.name = snapshot.string(snapshot.sections['local_names'][i], snapshot.sections['local_name_lengths'][i]).decode('ascii')
+            value.start = bytes(snapshot.sections['local_ranges'][i * 8:i * 8 + 4])
+            value.end = bytes(snapshot.sections['local_ranges'][i * 8 + 4:i * 8 + 8])
+            return WorkingData.from_data(WorkingType.LOCAL, snapshot.sections['local_addresses'][i], value, register=False)
+
+        def upvalue(i):
+            i += upvalueStart
+            value = LuaUpvalue()
+            value.name = snapshot.string(snapshot.sections['upvalue_names'][i], snapshot.sections['upvalue_name_lengths'][i]).decode('utf-8')
+            return WorkingData.from_data(WorkingType.UPVALUE, snapshot.sections['upvalue_addresses'][i], value, register=False)
+
+        self.instructions = LazySequence(numInstructions, instruction)
+        self.constants = LazySequence(numConstants, lambda i: snapshot.constant(constantStart + i))
+        self.chunks = LazySequence(numChildren, child)
+        self.debug = {
+            'lines': LazySequence(numLines, line),
+            'locals': LazySequence(numLocals, local),
+            'upvalues': LazySequence(numUpvalueNames, upvalue)
+        }
+
+class SnapshotBytecode(LuaBytecode):
+    # a LuaBytecode over a snapshot buffer, nothing registers with WorkingDataObjects
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = memoryview(buffer)
+        if len(self.buffer) < Header.size:
+            raise LuaBytecodeError("truncated snapshot header")
+        magic, version, sectionCount, header, numPrototypes = Header.unpack_from(self.buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise LuaBytecodeError("not a snapshot")
+        if version != SNAPSHOT_VERSION or sectionCount != len(Sections):
+            raise LuaBytecodeError(f"unsupported snapshot version {version}")
+        if sys.byteorder != 'little':
+            raise LuaBytecodeError("snapshots are only mapped on little-endian hosts")
+
+        self.sections = {}
+        for i, (name, typecode) in enumerate(Sections.items()):
+            offset, length = DirectoryEntry.unpack_from(self.buffer, Header.size + i * DirectoryEntry.size)
+            if offset + length > len(self.buffer):
+                raise LuaBytecodeError(f"snapshot section {name} out of range", offset)
+            section = self.buffer[offset:offset + length]
+            self.sections[name] = section.cast(typecode) if typecode is not None else section
+
+        fields = [WorkingData.from_data(WorkingType.HEADER, 4 + i, value, register=False) for i, value in enumerate(header[4:])]
+        self.signature = WorkingData.from_data(WorkingType.HEADER, 0, header[:4], register=False)
+        (self.version, self.format, self.endianness, self.intSize, self.sizeTSize,
+         self.instructionSize, self.numberSize, self.integralFlag) = fields
+
+        self.strings = LuaStringTable()
+        self.prototypes = LazySequence(numPrototypes, lambda i: SnapshotChunk(self, i))
+        self.chunks = LazySequence(numPrototypes, self.function)
+
+    def chunk(self, index):
+        return self.prototypes[index]
+
+    def function(self, index):
+        chunk = self.chunk(index)
+        chunk.function = WorkingData.from_data(WorkingType.FUNCTION, chunk.__startAddress__, chunk, register=False)
+        return chunk.function
+
+    def string(self, offset, length):
+        return bytes(self.sections['strings'][offset:offset + length])
+
+    def constant(self, index):
+        constant = LuaConstant()
+        constant.type = LuaConstantType(self.sections['constant_types'][index])
+        data = self.sections['constant_data'][index]
+        if constant.type == LuaConstantType.String:
+            constant.string = self.strings.intern(self.string(data, self.sections['constant_lengths'][index]))
+        elif constant.type == LuaConstantType.Number:
+            constant.literal = struct.unpack('<d', struct.pack('<Q', data))[0]
+        elif constant.type == LuaConstantType.Boolean:
+            constant.literal = data == 1
+        return WorkingData.from_data(WorkingType.CONSTANT, self.sections['constant_addresses'][index], constant, register=False)
+
+def read_snapshot(buffer):
+    return SnapshotBytecode(buffer)
+
+def open_snapshot(path):
+    with open(path, 'rb') as file:
+        return SnapshotBytecode(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', help='Compiled Lua file to snapshot.')
+    parser.add_argument('output', help='Snapshot file to write.')
+
+    args = parser.parse_args()
+    with open(args.file, 'rb') as file:
+        bytecode = LuaBytecode.read(file.read())
+    with open(args.output, 'wb') as file:
+        write_snapshot(bytecode, file)
@@ -0,0 +1,233 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import sqlite3
+
+from lua_bytecode import LuaBytecode
+from lua_instruction import LuaRegisterName
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT
+);
+CREATE TABLE IF NOT EXISTS functions (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER,
+    parent_id INTEGER,
+    address INTEGER,
+    source TEXT,
+    line_defined INTEGER,
+    last_line_defined INTEGER,
+    num_upvalues INTEGER,
+    num_parameters INTEGER,
+    is_vararg INTEGER,
+    max_stack_size INTEGER,
+    num_instructions INTEGER,
+    num_constants INTEGER,
+    num_functions INTEGER
+);
+CREATE TABLE IF NOT EXISTS instructions (
+    function_id INTEGER,
+    pc INTEGER,
+    address INTEGER,
+    opcode INTEGER,
+    name TEXT,
+    a INTEGER,
+    b INTEGER,
+    c INTEGER,
+    bx INTEGER,
+    sbx INTEGER
+);
+CREATE TABLE IF NOT EXISTS constants (
+    function_id INTEGER,
+    idx INTEGER,
+    address INTEGER,
+    type TEXT,
+    value
+);
+CREATE TABLE IF NOT EXISTS locals (
+    function_id INTEGER,
+    idx INTEGER,
+    address INTEGER,
+    name TEXT,
+    start_pc INTEGER,
+    end_pc INTEGER
+);
+CREATE TABLE IF NOT EXISTS upvalues (
+    function_id INTEGER,
+    idx INTEGER,
+    address INTEGER,
+    name TEXT
+);
+"""
+
+# indexes are built once after the bulk insert, which is much cheaper than maintaining them row by row
+INDEXES = """
+CREATE INDEX IF NOT EXISTS functions_file ON functions (file_id);
+CREATE INDEX IF NOT EXISTS functions_parent ON functions (parent_id);
+CREATE INDEX IF NOT EXISTS functions_num_constants ON functions (num_constants);
+CREATE INDEX IF NOT EXISTS instructions_function ON instructions (function_id, pc);
+CREATE INDEX IF NOT EXISTS instructions_opcode ON instructions (opcode, a);
+CREATE INDEX IF NOT EXISTS constants_function ON constants (function_id, idx);
+CREATE INDEX IF NOT EXISTS constants_value ON constants (value);
+CREATE INDEX IF NOT EXISTS locals_function ON locals (function_id, idx);
+CREATE INDEX IF NOT EXISTS upvalues_function ON upvalues (function_id, idx);
+"""
+
+TABLES = ['functions', 'instructions', 'constants', 'locals', 'upvalues']
+
+def connect(database, staging=False):
+    connection = sqlite3.connect(database, isolation_level=None)
+    if staging:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+    connection.executescript(SCHEMA)
+    return connection
+
+def next_id(connection, table):
+    return connection.execute(f'SELECT COALESCE(MAX(id), -1) + 1 FROM {table}').fetchone()[0]
+
+def export(bytecode, connection, path=None):
+    byteorder = 'big' if bytecode.endianness.value == 0 else 'little'
+
+    fileId = next_id(connection, 'files')
+    firstId = next_id(connection, 'functions')
+    functionIds = {id(data.value): firstId + i for i, data in enumerate(bytecode.chunks)}
+
+    functions, instructions, constants, locals, upvalues = [], [], [], [], []
+    for data in bytecode.chunks:
+        chunk = data.value
+        functionId = functionIds[id(chunk)]
+
+        functions.append((
+            functionId, fileId, None, data.address, chunk.source,
+            chunk.lineDefined, chunk.lastLineDefined, chunk.numUpvalues, chunk.numParameters,
+            chunk.isVararg, chunk.maxStackSize,
+            len(chunk.instructions), len(chunk.constants), len(chunk.chunks)
+        ))
+
+        for pc, instruction in enumerate(chunk.instructions):
+            registers = instruction.value.registers
+            instructions.append((
+                functionId, pc, instruction.address,
+                int(instruction.value.opcode), str(instruction.value.opcode),
+                registers[LuaRegisterName.A].value,
+                registers[LuaRegisterName.B].value,
+                registers[LuaRegisterName.C].value,
+                registers[LuaRegisterName.Bx].value,
+                registers[LuaRegisterName.sBx].value
+            ))
+
+        for i, constant in enumerate(chunk.constants):
+            constants.append((functionId, i, constant.address, str(constant.value.type), constant.value.text()))
+
+        for i, local in enumerate(chunk.debug['locals']):
+            locals.append((
+                functionId, i, local.address, local.value.name.rstrip('\x00'),
+                int.from_bytes(local.value.start, byteorder=byteorder),
+                int.from_bytes(local.value.end, byteorder=byteorder)
+            ))
+
+        for i, upvalue in enumerate(chunk.debug['upvalues']):
+            upvalues.append((functionId, i, upvalue.address, upvalue.value.name.rstrip('\x00')))
+
+    # parent ids can only be filled once every function has an id
+    parents = {}
+    for data in bytecode.chunks:
+        for child in data.value.chunks:
+            parents[functionIds[id(child)]] = functionIds[id(data.value)]
+    functions = [row[:2] + (parents.get(row[0]),) + row[3:] for row in functions]
+
+    connection.execute('BEGIN')
+    try:
+        connection.execute('INSERT INTO files VALUES (?, ?)', (fileId, path))
+        connection.executemany('INSERT INTO functions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', functions)
+        connection.executemany('INSERT INTO instructions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', instructions)
+        connection.executemany('INSERT INTO constants VALUES (?, ?, ?, ?, ?)', constants)
+        connection.executemany('INSERT INTO locals VALUES (?, ?, ?, ?, ?, ?)', locals)
+        connection.executemany('INSERT INTO upvalues VALUES (?, ?, ?, ?)', upvalues)
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+
+    return fileId
+
+def export_file(path, connection):
+    # the rows hold everything needed, nothing read here is kept registered, so memory stays flat over many files
+    with open(path, 'rb') as file:
+        bytecode = LuaBytecode.read(file.read(), register=False)
+    return export(bytecode, connection, path)
+
+def export_staging(staging, paths):
+    connection = connect(staging, staging=True)
+    for path in paths:
+        export_file(path, connection)
+    connection.close()
+    return staging
+
+def merge(connection, staging):
+    connection.execute('ATTACH DATABASE ? AS staging', (staging,))
+    try:
+        fileOffset = next_id(connection, 'files')
+        functionOffset = next_id(connection, 'functions')
+
+        connection.execute('BEGIN')
+        try:
+            merge_tables(connection, fileOffset, functionOffset)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+    finally:
+        connection.execute('DETACH DATABASE staging')
+
+def merge_tables(connection, fileOffset, functionOffset):
+    connection.execute('INSERT INTO files SELECT id + ?, path FROM staging.files', (fileOffset,))
+    connection.execute(
+        'INSERT INTO functions SELECT id + ?1, file_id + ?2, parent_id + ?1, address, source, line_defined, last_line_defined, '
+        'num_upvalues, num_parameters, is_vararg, max_stack_size, num_instructions, num_constants, num_functions '
+        'FROM staging.functions',
+        (functionOffset, fileOffset)
+    )
+    for table in TABLES[1:]:
+        columns = [row[1] for row in connection.execute(f'PRAGMA staging.table_info({table})')]
+        selected = ', '.join(['function_id + ?'] + columns[1:])
+        connection.execute(f'INSERT INTO {table} SELECT {selected} FROM staging.{table}', (functionOffset,))
+
+def export_files(paths, database, workers=None):
+    workers = workers or os.cpu_count() or 1
+    connection = connect(database)
+
+    if workers == 1 or len(paths) == 1:
+        for path in paths:
+            export_file(path, connection)
+    else:
+        # every worker fills its own staging database, those are merged into the target at the end
+        groups = [paths[i::workers] for i in range(workers) if paths[i::workers]]
+        stagings = [f"{database}.{i}.staging" for i in range(len(groups))]
+        for staging in stagings:
+            if os.path.exists(staging):
+                os.remove(staging)
+
+        try:
+            with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+                for staging in pool.map(export_staging, stagings, groups):
+                    merge(connection, staging)
+        finally:
+            for staging in stagings:
+                if os.path.exists(staging):
+                    os.remove(staging)
+
+    connection.executescript(INDEXES)
+    connection.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('database', help='SQLite database to export into, created if missing.')
+    parser.add_argument('files', nargs='+', help='Compiled Lua files to export.')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Number of worker processes.')
+
+    args = parser.parse_args()
+    export_files(args.files, args.database, args.workers)
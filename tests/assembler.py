@@ -0,0 +1,49 @@
+import os
+
+from lua_bytecode import LuaBytecode
+from lua_constant import LuaConstant, LuaConstantType, LuaString
+from lua_instruction import LuaInstruction
+from working_data import WorkingData, WorkingType
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simple')
+
+def sample(name):
+    with open(os.path.join(SAMPLES, name), 'rb') as file:
+        return file.read()
+
+def ins(opcode, a=0, b=0, c=0, bx=None, sbx=None):
+    raw = int(opcode) | a << 6
+    if bx is not None:
+        raw |= bx << 14
+    elif sbx is not None:
+        raw |= (sbx + 131071) << 14
+    else:
+        raw |= c << 14 | b << 23
+    return raw
+
+def K(index):
+    return 256 + index
+
+def constant(value):
+    result = LuaConstant()
+    if isinstance(value, str):
+        result.type = LuaConstantType.String
+        result.string = LuaString(value.encode('utf-8') + b'\x00')
+    else:
+        result.type = LuaConstantType.Number
+        result.value = float(value)
+    return result
+
+def assemble(constants, code, maxStackSize=10):
+    # a main function with the given constants and instruction words, serialized as a complete file
+    bytecode = LuaBytecode.read(sample('helloworld.out'), register=False)
+    chunk = bytecode.chunks[0].value
+    chunk.maxStackSize = maxStackSize
+    chunk.constants = [WorkingData.from_data(WorkingType.CONSTANT, 0, constant(value), register=False) for value in constants]
+    chunk.instructions = []
+    for raw in code:
+        instruction = LuaInstruction.decode(raw)
+        instruction.chunk = chunk
+        chunk.instructions.append(WorkingData.from_data(WorkingType.INSTRUCTION, 0, instruction, register=False))
+    chunk.debug = {'lines': [], 'locals': [], 'upvalues': []}
+    return bytecode.write()
@@ -0,0 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from working_data import WorkingDataObjects
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    WorkingDataObjects.clear()
+    yield
+    WorkingDataObjects.clear()
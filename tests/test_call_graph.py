@@ -0,0 +1,24 @@
+from assembler import K, assemble, ins, sample
+from call_graph import CallGraph
+from lua_bytecode import LuaBytecode
+from lua_instruction import LuaOpcode as O
+
+def test_numeric_for_loop():
+    # for i = 1, 10 do print(i) end
+    data = assemble([1, 10, 'print'], [
+        ins(O.LOADK, 0, bx=0), ins(O.LOADK, 1, bx=1), ins(O.LOADK, 2, bx=0), ins(O.FORPREP, 0, sbx=3),
+        ins(O.GETGLOBAL, 4, bx=2), ins(O.MOVE, 5, 3), ins(O.CALL, 4, 2, 1), ins(O.FORLOOP, 0, sbx=-4),
+        ins(O.RETURN, 0, 1)
+    ])
+    bytecode = LuaBytecode.read(data)
+    graph = CallGraph(bytecode)
+    main = bytecode.chunks[0]
+    assert graph.callees(main) == []
+    assert graph.callers(main) == []
+
+def test_global_function_calls():
+    bytecode = LuaBytecode.read(sample('math.out'))
+    graph = CallGraph(bytecode)
+    main, add = bytecode.chunks[0], bytecode.chunks[1]
+    assert add in graph.callees(main)
+    assert main in graph.callers(add)
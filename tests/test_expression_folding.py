@@ -0,0 +1,93 @@
+from assembler import K, assemble, ins, sample
+from expression_folding import fold_chunk
+from lua_bytecode import LuaBytecode
+from lua_instruction import LuaOpcode as O
+from output_system import OutputSystem
+
+def fold(data, index=0):
+    output_system = OutputSystem()
+    output_system.colored = False
+    chunk = LuaBytecode.read(data).chunks[index].value
+    # the address column is dropped, it only depends on where the code was assembled
+    return [line.split(None, 1)[1].rstrip() for line in fold_chunk(chunk, output_system)]
+
+def test_nested_call():
+    assert fold(sample('math.out'))[-2:] == ['print(add(2, 2))', 'return']
+
+def test_concat_arguments():
+    lines = fold(sample('determinism.out'))
+    assert 'print("Welcome, " .. result .. "!")' in lines
+    assert 'print("Issue: " .. message)' in lines
+
+def test_read_stays_before_call():
+    # local x = t.a; f(); print(x)
+    assert fold(assemble(['t', 'a', 'f', 'print'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.GETTABLE, 0, 0, K(1)), ins(O.GETGLOBAL, 1, bx=2), ins(O.CALL, 1, 1, 1),
+        ins(O.GETGLOBAL, 1, bx=3), ins(O.MOVE, 2, 0), ins(O.CALL, 1, 2, 1), ins(O.RETURN, 0, 1)
+    ])) == ['R(0) = t.a', 'f()', 'print(R(0))', 'return']
+
+def test_read_stays_before_store():
+    # local v = x; x = 5; print(v)
+    assert fold(assemble(['x', 5, 'print'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.LOADK, 1, bx=1), ins(O.SETGLOBAL, 1, bx=0), ins(O.GETGLOBAL, 1, bx=2),
+        ins(O.MOVE, 2, 0), ins(O.CALL, 1, 2, 1), ins(O.RETURN, 0, 1)
+    ])) == ['R(0) = x', 'x = 5', 'print(R(0))', 'return']
+
+def test_calls_keep_order():
+    # f(g(), h())
+    assert fold(assemble(['f', 'g', 'h'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.GETGLOBAL, 1, bx=1), ins(O.CALL, 1, 1, 2), ins(O.GETGLOBAL, 2, bx=2),
+        ins(O.CALL, 2, 1, 2), ins(O.CALL, 0, 3, 1), ins(O.RETURN, 0, 1)
+    ])) == ['f(g(), h())', 'return']
+
+def test_reversed_call_operands():
+    # R0 = g(); R1 = h(); b = R1 + R0 must not print h() before g()
+    assert fold(assemble(['g', 'h', 'b'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.CALL, 0, 1, 2), ins(O.GETGLOBAL, 1, bx=1), ins(O.CALL, 1, 1, 2),
+        ins(O.ADD, 2, 1, 0), ins(O.SETGLOBAL, 2, bx=2), ins(O.RETURN, 0, 1)
+    ])) == ['R(0) = g()', 'R(1) = h()', 'b = R(1) + R(0)', 'return']
+
+def test_reversed_global_operands():
+    # c = b - a with a read before b
+    assert fold(assemble(['a', 'b', 'c'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.GETGLOBAL, 1, bx=1), ins(O.SUB, 2, 1, 0), ins(O.SETGLOBAL, 2, bx=2),
+        ins(O.RETURN, 0, 1)
+    ])) == ['R(0) = a', 'R(1) = b', 'c = R(1) - R(0)', 'return']
+
+def test_ordered_operands():
+    assert fold(assemble(['a', 'b', 'c'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.GETGLOBAL, 1, bx=1), ins(O.SUB, 2, 0, 1), ins(O.SETGLOBAL, 2, bx=2),
+        ins(O.RETURN, 0, 1)
+    ])) == ['c = a - b', 'return']
+
+def test_overwritten_register():
+    assert fold(assemble([7, 'print'], [
+        ins(O.MOVE, 1, 0), ins(O.LOADK, 0, bx=0), ins(O.GETGLOBAL, 2, bx=1), ins(O.MOVE, 3, 1), ins(O.MOVE, 4, 0),
+        ins(O.CALL, 2, 3, 1), ins(O.RETURN, 0, 1)
+    ])) == ['R(1) = R(0)', 'print(R(1), 7)', 'return']
+
+def test_method_call():
+    # obj.x:m(1, g())
+    assert fold(assemble(['obj', 'x', 'm', 1, 'g'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.GETTABLE, 0, 0, K(1)), ins(O.SELF, 0, 0, K(2)), ins(O.LOADK, 2, bx=3),
+        ins(O.GETGLOBAL, 3, bx=4), ins(O.CALL, 3, 1, 0), ins(O.CALL, 0, 0, 1), ins(O.RETURN, 0, 1)
+    ])) == ['obj.x:m(1, g())', 'return']
+
+def test_vararg():
+    assert fold(assemble(['print'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.VARARG, 1, 0), ins(O.CALL, 0, 0, 1), ins(O.RETURN, 0, 1)
+    ])) == ['print(...)', 'return']
+
+def test_multiple_results():
+    # a, b = f()
+    assert fold(assemble(['f', 'a', 'b'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.CALL, 0, 1, 3), ins(O.SETGLOBAL, 1, bx=2), ins(O.SETGLOBAL, 0, bx=1),
+        ins(O.RETURN, 0, 1)
+    ])) == ['R(0), R(1) = f()', 'b = R(1)', 'a = R(0)', 'return']
+
+def test_values_live_past_the_block_are_kept():
+    # x = a and b
+    assert fold(assemble(['a', 'b', 'x'], [
+        ins(O.GETGLOBAL, 0, bx=0), ins(O.TEST, 0, 0, 0), ins(O.JMP, sbx=1), ins(O.GETGLOBAL, 0, bx=1),
+        ins(O.SETGLOBAL, 0, bx=2), ins(O.RETURN, 0, 1)
+    ]))[0] == 'R(0) = a'
@@ -0,0 +1,66 @@
+import gc
+import weakref
+
+from assembler import sample
+from lua_bytecode import LuaBytecode, iter_prototypes
+from working_data import WorkingDataObjects
+
+def nested(tmp_path):
+    # math.out with its functions rearranged into main -> add -> (mul, div) and main -> sub -> mod
+    bytecode = LuaBytecode.read(sample('math.out'), register=False)
+    main, add, sub, mul, div, mod = [function.value for function in bytecode.chunks]
+    main.chunks = [add, sub]
+    add.chunks = [mul, div]
+    sub.chunks = [mod]
+    data = bytecode.write()
+    (tmp_path / 'nested.out').write_bytes(data)
+    return str(tmp_path / 'nested.out'), data
+
+def fields(chunk):
+    return (chunk.__startAddress__, chunk.source, chunk.lineDefined, chunk.lastLineDefined, chunk.numUpvalues,
+            chunk.numParameters, chunk.isVararg, chunk.maxStackSize)
+
+def contents(chunk):
+    return ([instruction.value.encode() for instruction in chunk.instructions],
+            [constant.value.key() for constant in chunk.constants],
+            [(local.address, local.value.name) for local in chunk.debug['locals']])
+
+def test_iter_prototypes_order_and_paths(tmp_path):
+    path, data = nested(tmp_path)
+    expected = LuaBytecode.read(data, register=False)
+    paths = {}
+    def walk(chunk, chunkPath):
+        paths[chunk.__startAddress__] = chunkPath
+        for index, child in enumerate(chunk.chunks):
+            walk(child, chunkPath + (index,))
+    walk(expected.chunks[0].value, ())
+
+    prototypes = list(iter_prototypes(path))
+    assert [prototypePath for prototypePath, chunk in prototypes] == [(), (0,), (0, 0), (0, 1), (1,), (1, 0)]
+    assert len(prototypes) == len(expected.chunks)
+    for (prototypePath, chunk), function in zip(prototypes, expected.chunks):
+        assert paths[chunk.__startAddress__] == prototypePath
+        assert fields(chunk) == fields(function.value)
+        assert contents(chunk) == contents(function.value)
+    assert len(WorkingDataObjects) == 0
+
+def test_iter_prototypes_child_stubs(tmp_path):
+    path, data = nested(tmp_path)
+    expected = LuaBytecode.read(data, register=False)
+    for (prototypePath, chunk), function in zip(iter_prototypes(path), expected.chunks):
+        # children carry their header fields only, they are decoded when yielded themselves
+        assert [fields(child) for child in chunk.chunks] == [fields(child) for child in function.value.chunks]
+        for child in chunk.chunks:
+            assert child.instructions == [] and child.constants == [] and child.chunks == []
+        assert len(WorkingDataObjects) == 0
+
+def test_iter_prototypes_frees_yielded_chunks(tmp_path):
+    path, data = nested(tmp_path)
+    previous = None
+    for prototypePath, chunk in iter_prototypes(path):
+        current = weakref.ref(chunk)
+        del chunk
+        gc.collect()
+        if previous is not None:
+            assert previous() is None
+        previous = current
@@ -0,0 +1,83 @@
+from io import BytesIO
+import math
+
+from assembler import assemble, ins, sample
+from lua_bytecode import LuaBytecode
+from lua_constant import LuaConstant, LuaConstantType, LuaStringTable
+from lua_instruction import LuaOpcode as O
+from working_data import WorkingData
+
+def strings(bytecode):
+    return [constant.value for function in bytecode.chunks for constant in function.value.constants
+            if constant.value.type == LuaConstantType.String]
+
+def test_shared_string_table():
+    table = LuaStringTable()
+    hello = LuaBytecode.read(sample('helloworld.out'), table, register=False)
+    maths = LuaBytecode.read(sample('math.out'), table, register=False)
+    assert hello.strings is table and maths.strings is table
+
+    # print is in both files and is interned once, reading a file again adds nothing
+    shared = {constant.string.raw: constant.string for constant in strings(hello)}
+    for constant in strings(maths):
+        assert table.intern(constant.string.raw) is constant.string
+        if constant.string.raw in shared:
+            assert shared[constant.string.raw] is constant.string
+    assert len(table) == 7
+    again = LuaBytecode.read(sample('math.out'), table, register=False)
+    assert [constant.string for constant in strings(again)] == [constant.string for constant in strings(maths)]
+    assert len(table) == 7
+
+    # without a shared table every file has its own strings
+    other = LuaBytecode.read(sample('math.out'), register=False)
+    assert other.strings is not table
+    assert all(a.string is not b.string and a.key() == b.key() for a, b in zip(strings(other), strings(maths)))
+
+def test_string_rendering():
+    # as before interning: value is the decoded string quoted with its NUL, text() drops the quotes and NUL
+    for name in ['helloworld.out', 'math.out', 'determinism.out']:
+        for constant in strings(LuaBytecode.read(sample(name), register=False)):
+            value = '"' + constant.string.raw.decode('utf-8') + '"'
+            assert constant.value == value
+            assert constant.text() == value[1:-1].rstrip('\x00')
+
+    constant = strings(LuaBytecode.read(sample('helloworld.out'), register=False))[1]
+    assert constant.value == '"Hello, World!\x00"'
+    assert constant.text() == 'Hello, World!'
+
+    chunk = LuaBytecode.read(assemble(['héllo', 7], [ins(O.RETURN, 0, 1)]), register=False).chunks[0].value
+    assert chunk.constants[0].value.value == '"héllo\x00"'
+    assert chunk.constants[0].value.text() == 'héllo'
+    assert chunk.constants[1].value.value == 7.0
+    assert chunk.constants[1].value.text() == 7.0
+
+def test_boolean_round_trip():
+    sizes = [WorkingData.from_data(None, None, size, register=False) for size in [4, 8, 4, 8]]
+    constant = LuaConstant()
+    constant.type = LuaConstantType.Boolean
+    constant.value = True
+    stream = BytesIO()
+    constant.write('little', sizes, stream)
+    stream.seek(0)
+    read = LuaConstant.read('little', sizes, stream)
+    assert read.value is True and read.text() is True
+    assert read.key() == constant.key()
+
+def test_keys_and_unique_constants():
+    bytecode = LuaBytecode.read(assemble(['a', 'b', 'a', 1, 1.0, 0.0, -0.0, math.nan, math.nan], [ins(O.RETURN, 0, 1)]),
+                                register=False)
+    constants = bytecode.chunks[0].value.constants
+    keys = [constant.value.key() for constant in constants]
+    assert keys[0] == keys[2] and keys[0] != keys[1]
+    assert keys[3] == keys[4]
+    # by bit pattern: the zeros differ and NaN equals itself
+    assert keys[5] != keys[6]
+    assert keys[7] == keys[8]
+
+    unique = bytecode.unique_constants()
+    assert len(unique) == 6
+    assert unique[keys[0]] == [constants[0], constants[2]]
+    assert unique[keys[1]] == [constants[1]]
+    assert unique[keys[3]] == [constants[3], constants[4]]
+    assert unique[keys[7]] == [constants[7], constants[8]]
+    assert sum(len(group) for group in unique.values()) == len(constants)
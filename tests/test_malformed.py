@@ -0,0 +1,55 @@
+import pytest
+
+from assembler import assemble, ins, sample
+from lua_bytecode import LuaBytecode, iter_prototypes
+from lua_instruction import LuaOpcode as O
+from lua_reader import LuaBytecodeError
+from lua_verifier import verify
+
+SOURCE_SIZE = 12 # size_t of the main function's source string, right after the header
+
+def corrupt(name, address, data):
+    bytecode = bytearray(sample(name))
+    bytecode[address:address + len(data)] = data
+    return bytes(bytecode)
+
+def test_invalid_source():
+    with pytest.raises(LuaBytecodeError) as error:
+        LuaBytecode.read(corrupt('helloworld.out', SOURCE_SIZE + 5, b'\xff'))
+    assert error.value.address == SOURCE_SIZE + 4
+
+def test_invalid_local_name():
+    # the name of the first local of add, math.out has an 8 byte size_t
+    with pytest.raises(LuaBytecodeError) as error:
+        LuaBytecode.read(corrupt('math.out', 346 + 8, b'\xe9'))
+    assert error.value.address == 346 + 8
+
+def test_source_size_past_end():
+    with pytest.raises(LuaBytecodeError) as error:
+        LuaBytecode.read(corrupt('helloworld.out', SOURCE_SIZE, b'\xff\xff\xff\xff'))
+    assert error.value.address == SOURCE_SIZE + 4
+
+def test_source_size_beyond_read_limit():
+    # more than read() accepts, it raised OverflowError
+    with pytest.raises(LuaBytecodeError) as error:
+        LuaBytecode.read(corrupt('math.out', SOURCE_SIZE, b'\xff' * 8))
+    assert error.value.address == SOURCE_SIZE + 8
+
+def test_closure_upvalue_words_past_end():
+    # add claims more upvalues than there are words after main's CLOSURE
+    bytecode = LuaBytecode.read(sample('math.out'))
+    bytecode.chunks[1].value.numUpvalues = 50
+    violations = verify(LuaBytecode.read(bytecode.write()))
+    assert [(violation.pc, violation.message) for violation in violations] == [(0, "CLOSURE needs 50 operand word(s) after it, only 16 left")]
+
+def test_setlist_block_word_past_end():
+    violations = verify(LuaBytecode.read(assemble([], [ins(O.RETURN, 0, 1), ins(O.SETLIST, 0, 1, 0)])))
+    assert [(violation.pc, violation.message) for violation in violations] == [(1, "SETLIST needs 1 operand word(s) after it, only 0 left")]
+
+def test_unknown_constant_type_in_scan(tmp_path):
+    address = LuaBytecode.read(sample('math.out')).chunks[0].value.constants[0].address
+    path = tmp_path / 'math.out'
+    path.write_bytes(corrupt('math.out', address, b'\x07'))
+    with pytest.raises(LuaBytecodeError) as error:
+        list(iter_prototypes(str(path)))
+    assert error.value.address == address
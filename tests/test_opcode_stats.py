@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+from assembler import SAMPLES, sample
+from lua_bytecode import LuaBytecode
+from opcode_stats import file_stats
+
+def decoded_stats(name):
+    bytecode = LuaBytecode.read(sample(name), register=False)
+    opcodes = [0] * 64
+    A = [0] * 256
+    for function in bytecode.chunks:
+        for instruction in function.value.instructions:
+            opcodes[int(instruction.value.opcode)] += 1
+            A[instruction.value.encode() >> 6 & 0xFF] += 1
+    return len(bytecode.chunks), opcodes, A
+
+def check_samples():
+    for name in ['helloworld.out', 'math.out', 'determinism.out']:
+        stats = file_stats(os.path.join(SAMPLES, name))
+        functions, opcodes, A = decoded_stats(name)
+        assert stats['functions'] == functions
+        assert stats['instructions'] == sum(opcodes)
+        assert stats['opcodes'] == opcodes
+        assert stats['A'] == A
+
+def test_file_stats_numpy():
+    pytest.importorskip('numpy')
+    check_samples()
+
+def test_file_stats_fallback(monkeypatch):
+    # a None entry makes the import raise ImportError
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    check_samples()
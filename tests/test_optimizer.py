@@ -0,0 +1,90 @@
+import os
+
+from assembler import SAMPLES, K, assemble, ins, sample
+from lua_bytecode import LuaBytecode
+from lua_instruction import LuaOpcode as O, LuaRegisterName
+from lua_local import LuaLocal
+from optimizer import optimize, optimize_file, verify_output
+from working_data import WorkingData, WorkingDataObjects, WorkingType
+
+def optimized(bytecode, passes):
+    optimize(bytecode, passes)
+    data = bytecode.write()
+    verify_output(data)
+    return LuaBytecode.read(data).chunks[0].value
+
+def code(chunk):
+    return [(str(instruction.value.opcode), instruction.value.get_register(0), instruction.value.get_register(1),
+             instruction.value.get_register(2)) for instruction in chunk.instructions]
+
+def loaded(chunk, pc):
+    # the value a LOADK or an RK operand in C refers to
+    instruction = chunk.instructions[pc].value
+    if instruction.opcode == O.LOADK:
+        return chunk.constants[instruction.registers[LuaRegisterName.Bx].value].value.value
+    return chunk.constants[instruction.registers[LuaRegisterName.C].value - 256].value.value
+
+def test_thread_jumps():
+    bytecode = LuaBytecode.read(assemble([], [
+        ins(O.JMP, sbx=1), ins(O.RETURN, 0, 1), ins(O.JMP, sbx=-2), ins(O.RETURN, 0, 1)
+    ]))
+    chunk = optimized(bytecode, ['thread-jumps'])
+    assert code(chunk)[0] == ('JMP', 0, None, None)
+
+def test_jump_cycle_is_kept():
+    bytecode = LuaBytecode.read(assemble([], [
+        ins(O.JMP, sbx=1), ins(O.JMP, sbx=0), ins(O.JMP, sbx=-2), ins(O.RETURN, 0, 1)
+    ]))
+    chunk = optimized(bytecode, ['thread-jumps'])
+    assert [instruction[1] for instruction in code(chunk)[:3]] == [1, 0, -2]
+
+def test_dead_code_keeps_lines_and_locals():
+    bytecode = LuaBytecode.read(assemble([1], [
+        ins(O.LOADK, 0, bx=0), ins(O.JMP, sbx=2), ins(O.LOADK, 1, bx=0), ins(O.LOADK, 2, bx=0),
+        ins(O.RETURN, 0, 2), ins(O.RETURN, 0, 1)
+    ]))
+    chunk = bytecode.chunks[0].value
+    chunk.debug['lines'] = [line.to_bytes(4, 'little') for line in range(10, 16)]
+    for name, start, end in [('a', 1, 6), ('b', 3, 4)]:
+        local = LuaLocal()
+        local.name, local.start, local.end = name + '\x00', start.to_bytes(4, 'little'), end.to_bytes(4, 'little')
+        chunk.debug['locals'].append(WorkingData.from_data(WorkingType.LOCAL, 0, local, register=False))
+
+    chunk = optimized(bytecode, ['dead-code'])
+    assert code(chunk) == [('LOADK', 0, 0, None), ('JMP', 0, None, None), ('RETURN', 0, 2, None), ('RETURN', 0, 1, None)]
+    assert [int.from_bytes(line, 'little') for line in chunk.debug['lines']] == [10, 11, 14, 15]
+    assert [(local.value.name, int.from_bytes(local.value.start, 'little'), int.from_bytes(local.value.end, 'little'))
+            for local in chunk.debug['locals']] == [('a\x00', 1, 4), ('b\x00', 2, 2)]
+
+def test_merge_and_prune_large_pool():
+    # 299 repeats 5, LOADK reaches past 255 through Bx while RK operands stay below 256
+    constants = list(range(299)) + [5]
+    bytecode = LuaBytecode.read(assemble(constants, [
+        ins(O.LOADK, 0, bx=299), ins(O.LOADK, 1, bx=298), ins(O.ADD, 2, 0, K(200)), ins(O.RETURN, 0, 1)
+    ]))
+    chunk = optimized(bytecode, ['merge-constants', 'prune-constants'])
+    assert len(chunk.constants) == 3
+    assert [loaded(chunk, pc) for pc in range(3)] == [5, 298, 200]
+
+def test_merge_only_keeps_values():
+    # without pruning the copies stay, a Bx past 255 has to keep pointing at an equal constant
+    constants = list(range(299)) + [5]
+    bytecode = LuaBytecode.read(assemble(constants, [
+        ins(O.LOADK, 0, bx=299), ins(O.LOADK, 1, bx=298), ins(O.ADD, 2, 0, K(200)), ins(O.RETURN, 0, 1)
+    ]))
+    chunk = optimized(bytecode, ['merge-constants'])
+    assert [loaded(chunk, pc) for pc in range(3)] == [5, 298, 200]
+
+def test_default_passes_on_sample():
+    bytecode = LuaBytecode.read(sample('math.out'))
+    expected = [code(function.value) for function in bytecode.chunks]
+    optimize(bytecode)
+    verify_output(bytecode.write())
+    assert [code(function.value) for function in LuaBytecode.read(bytecode.write()).chunks] == expected
+
+def test_optimize_file_registers_nothing(tmp_path):
+    size, optimizedSize, reports = optimize_file(os.path.join(SAMPLES, 'math.out'), tmp_path / 'math.out')
+    assert size == len(sample('math.out'))
+    assert len(WorkingDataObjects) == 0
+    registered = LuaBytecode.read((tmp_path / 'math.out').read_bytes())
+    assert len(WorkingDataObjects) == len(list(registered.working_data()))
@@ -0,0 +1,38 @@
+import parallel_reader
+from assembler import sample
+from lua_bytecode import LuaBytecode
+from lua_verifier import verify
+from parallel_reader import read_parallel
+from working_data import WorkingDataObjects
+
+def read_both(tmp_path, monkeypatch, data):
+    monkeypatch.setattr(parallel_reader, 'PARALLEL_THRESHOLD', 0)
+    path = tmp_path / 'file.out'
+    path.write_bytes(data)
+    serial = LuaBytecode.read(data)
+    WorkingDataObjects.clear()
+    violations = []
+    return serial, read_parallel(str(path), 2, violations), violations
+
+def test_matches_serial_read(tmp_path, monkeypatch):
+    data = sample('math.out')
+    serial, bytecode, violations = read_both(tmp_path, monkeypatch, data)
+    assert len(WorkingDataObjects) == 0
+    assert violations == []
+
+    assert [(data.type, data.address) for data in bytecode.working_data()] == [(data.type, data.address) for data in serial.working_data()]
+    for expected, function in zip(serial.chunks, bytecode.chunks):
+        assert [str(instruction.value) for instruction in function.value.instructions] == [str(instruction.value) for instruction in expected.value.instructions]
+        assert [child.function for child in function.value.chunks] == [bytecode.chunks[serial.chunks.index(child.function)] for child in expected.value.chunks]
+    assert bytecode.write() == data
+
+def test_workers_verify(tmp_path, monkeypatch):
+    bytecode = LuaBytecode.read(sample('math.out'))
+    bytecode.chunks[2].value.maxStackSize = 1
+    serial, bytecode, violations = read_both(tmp_path, monkeypatch, bytecode.write())
+
+    expected = verify(serial)
+    assert len(expected) > 0
+    assert [(violation.function.address, violation.address, violation.message) for violation in violations] == \
+        [(violation.function.address, violation.address, violation.message) for violation in expected]
+    assert violations[0].function is bytecode.chunks[2]
@@ -0,0 +1,38 @@
+import pytest
+
+from assembler import sample
+from lua_bytecode import LuaBytecode
+from pattern_search import PatternAutomaton, PatternError, parse_patterns
+
+def brute_force(bytecode, pattern):
+    matches = []
+    for function in bytecode.chunks:
+        instructions = function.value.instructions
+        for start in range(len(instructions) - len(pattern.terms) + 1):
+            if all(term.matches(instructions[start + i].value) for i, term in enumerate(pattern.terms)):
+                matches.append((function.address, start))
+    return matches
+
+@pytest.mark.parametrize('source', [
+    'GETGLOBAL; LOADK; LOADK; CALL',
+    'GETGLOBAL[K="print"]; *; *; *; *; CALL[B=0]',
+    '*; RETURN',
+    # expanded term by term these were far more opcode sequences than the automaton was allowed to hold
+    '*; *; *; *',
+    'GETGLOBAL|MOVE|LOADK|CALL; *; *; *; *; RETURN',
+    'ADD|SUB|MUL|DIV|MOD; RETURN|TAILCALL; RETURN'
+])
+def test_matches_every_place(source):
+    bytecode = LuaBytecode.read(sample('math.out'))
+    pattern = parse_patterns([source])[0]
+    found = [(match.function.address, match.pc) for match in PatternAutomaton([pattern]).search(bytecode)]
+    assert sorted(found) == brute_force(bytecode, pattern)
+    assert len(found) > 0
+
+def test_repeated_alternative_matches_once():
+    bytecode = LuaBytecode.read(sample('math.out'))
+    assert len(PatternAutomaton(parse_patterns(['RETURN|RETURN'])).search(bytecode)) == 11
+
+def test_unknown_opcode():
+    with pytest.raises(PatternError):
+        parse_patterns(['GETGLOBAL; FOO'])
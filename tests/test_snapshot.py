@@ -0,0 +1,36 @@
+import io
+
+from assembler import sample
+from lua_bytecode import LuaBytecode
+from snapshot import read_snapshot, write_snapshot
+from tooling_api import render_pseudo
+from output_system import OutputSystem
+from working_data import WorkingDataObjects
+
+def snapshot_of(name):
+    stream = io.BytesIO()
+    write_snapshot(LuaBytecode.read(sample(name)), stream)
+    return stream.getvalue()
+
+def test_renders_without_registry():
+    # as in a worker process that only mapped the snapshot
+    data = snapshot_of('math.out')
+    output_system = OutputSystem()
+    output_system.colored = False
+    expected = render_pseudo(LuaBytecode.read(sample('math.out')).chunks[0].value, output_system)
+
+    WorkingDataObjects.clear()
+    bytecode = read_snapshot(data)
+    assert render_pseudo(bytecode.chunks[0].value, output_system) == expected
+    assert len(WorkingDataObjects) == 0
+
+def test_closure_shows_tag():
+    bytecode = read_snapshot(snapshot_of('math.out'))
+    bytecode.chunks[1].userDefinedTag = 'add'
+    output_system = OutputSystem()
+    output_system.colored = False
+    assert any('@ add' in line for line in render_pseudo(bytecode.chunks[0].value, output_system))
+
+def test_round_trip():
+    data = sample('determinism.out')
+    assert read_snapshot(snapshot_of('determinism.out')).write() == data
@@ -0,0 +1,17 @@
+import os
+
+from sqlite_export import connect, export_file
+from working_data import WorkingDataObjects
+
+SIMPLE = os.path.join(os.path.dirname(__file__), 'simple')
+
+def test_export_keeps_nothing_registered():
+    connection = connect(':memory:')
+    for name in ['helloworld.out', 'math.out']:
+        export_file(os.path.join(SIMPLE, name), connection)
+        assert len(WorkingDataObjects) == 0
+
+    assert connection.execute('SELECT COUNT(*) FROM files').fetchone()[0] == 2
+    assert connection.execute('SELECT COUNT(*) FROM functions').fetchone()[0] == 7
+    assert connection.execute("SELECT COUNT(*) FROM locals WHERE name = 'x'").fetchone()[0] == 5
+    connection.close()
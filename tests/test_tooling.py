@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import tooling
+from tooling_state import ToolingState
+
+SIMPLE = os.path.join(os.path.dirname(__file__), 'simple')
+
+@pytest.fixture
+def script(monkeypatch, capsys):
+    # runs lines against a fresh tool state as `tooling.py file -s script` would, returning (exit status, output)
+    def run(path, lines):
+        monkeypatch.setattr(tooling, 'tool_state', ToolingState())
+        monkeypatch.setattr(tooling, 'errors', 0)
+        monkeypatch.setattr(tooling, 'reported_load', False)
+        monkeypatch.setattr(tooling.output_system, 'colored', False)
+        tooling.tool_state.working_file = path
+        tooling.load_in_background()
+        capsys.readouterr()
+        with pytest.raises(SystemExit) as exit:
+            tooling.run_script(lines)
+        return exit.value.code, capsys.readouterr().out
+    return run
+
+def test_script_commands(script):
+    status, output = script(os.path.join(SIMPLE, 'math.out'), [
+        "# comments and blank lines are skipped",
+        "",
+        "list functions",
+        "select address 0x11a",
+        "tag add",
+        "select tag add",
+        "addr",
+        "verify",
+        'search GETGLOBAL[K="print"]',
+    ])
+    assert status == 0
+    assert output == ("function[17] @ 0xc\n"
+                      "function[3] @ 0x11a\n"
+                      "function[3] @ 0x182\n"
+                      "function[3] @ 0x1ea\n"
+                      "function[3] @ 0x252\n"
+                      "function[3] @ 0x2ba\n"
+                      "0x11a\n"
+                      "no verification issues found.\n"
+                      "function[17] @ 0xc 0x9d\n"
+                      "1 match(es)\n")
+
+def test_script_exit_stops_it(script):
+    status, output = script(os.path.join(SIMPLE, 'math.out'), ["help", "exit", "frobnicate"])
+    assert status == 0
+    assert "exit: exit the tooling" in output
+    assert "frobnicate" not in output
+
+def test_unknown_command_fails_script(script):
+    status, output = script(os.path.join(SIMPLE, 'math.out'), ["frobnicate", "select address 0x11a", "addr"])
+    # the script goes on after the error, the exit status still reports it
+    assert status == 1
+    assert "error: unknown command 'frobnicate', type 'help' for help." in output
+    assert output.endswith("0x11a\n")
+
+def test_bad_arguments_fail_script(script):
+    status, output = script(os.path.join(SIMPLE, 'math.out'), ["select nowhere 1"])
+    assert status == 1
+    # argparse words the rest differently across Python versions
+    assert output.startswith("error: argument type: invalid choice: 'nowhere'")
+
+def test_load_error_fails_script(script, tmp_path):
+    path = tmp_path / 'truncated.out'
+    with open(os.path.join(SIMPLE, 'math.out'), 'rb') as file:
+        path.write_bytes(file.read()[:100])
+    status, output = script(str(path), ["help", "list functions", "help"])
+    # commands not needing the file run, the first one that does stops the script
+    assert status == 1
+    assert "error: malformed bytecode" in output
+    assert output.count("help: print this help message") == 1
+
+def test_missing_file_fails_script(script, tmp_path):
+    status, output = script(str(tmp_path / 'missing.out'), ["list functions"])
+    assert status == 1
+    assert f"error: cannot load {tmp_path / 'missing.out'}" in output
@@ -0,0 +1,102 @@
+import os
+import shutil
+
+import tooling_api
+from lua_bytecode import LuaBytecode
+from lua_instruction import LuaOpcode
+from lua_verifier import verify
+from working_data import WorkingDataObjects
+
+SIMPLE = os.path.join(os.path.dirname(__file__), 'simple')
+
+def test_states_are_independent():
+    math = tooling_api.open(os.path.join(SIMPLE, 'math.out'))
+    hello = tooling_api.open(os.path.join(SIMPLE, 'helloworld.out'))
+    assert len(WorkingDataObjects) == 0
+
+    add = tooling_api.select(math, 'address', '0x11a')
+    assert add is math.working_code.chunks[1]
+    assert tooling_api.select(hello, 'address', '0x11a') is None
+
+    tooling_api.tag(math, add, 'add')
+    assert tooling_api.select(math, 'tag', 'add') is add
+    assert tooling_api.select(hello, 'tag', 'add') is None
+
+    main = math.working_code.chunks[0]
+    assert any('function[3] @ add' in line for line in tooling_api.disassemble(math, main, 'pseudo'))
+    assert any('function[3] @ add' in line for line in tooling_api.disassemble(math, main, 'fold'))
+    assert len(tooling_api.disassemble(hello, hello.working_code.chunks[0], 'pseudo')) > 0
+
+def test_select_after_reload(tmp_path):
+    path = str(tmp_path / 'math.out')
+    shutil.copy(os.path.join(SIMPLE, 'math.out'), path)
+    state = tooling_api.open(path, watch=True)
+
+    # touch the file so it reads as changed, nothing has to be decoded again
+    os.utime(path, ns=(0, 0))
+    assert tooling_api.changed(state)
+    assert tooling_api.reload(state) == 0
+    assert len(WorkingDataObjects) == 0
+    assert tooling_api.select(state, 'address', '0x11a') is state.working_code.chunks[1]
+
+def rewrite(path, change):
+    bytecode = LuaBytecode.read(open(path, 'rb').read())
+    change(bytecode)
+    with open(path, 'wb') as file:
+        file.write(bytecode.write())
+    # the stamp has to differ even when the size does not
+    os.utime(path, ns=(0, 0))
+
+def opcodes(function):
+    return [str(instruction.value.opcode) for instruction in function.value.instructions]
+
+def violations(state):
+    return [(violation.function.address, violation.address, violation.message) for violation in state.violations]
+
+def test_reload_edited_function(tmp_path):
+    path = str(tmp_path / 'math.out')
+    shutil.copy(os.path.join(SIMPLE, 'math.out'), path)
+    state = tooling_api.open(path, watch=True)
+    add, mod = state.working_code.chunks[1], state.working_code.chunks[5]
+    tooling_api.tag(state, add, 'add')
+    tooling_api.tag(state, add.value.instructions[0], 'sum')
+    tooling_api.tag(state, mod, 'mod')
+
+    def edit(bytecode):
+        bytecode.chunks[1].value.instructions[0].value.opcode = LuaOpcode.SUB
+        bytecode.chunks[5].value.maxStackSize = 1
+    rewrite(path, edit)
+    assert tooling_api.reload(state) == 2
+
+    assert state.working_code.chunks[1] is add
+    assert opcodes(add) == ['SUB', 'RETURN', 'RETURN']
+    assert tooling_api.select(state, 'tag', 'sum') is add.value.instructions[0]
+    assert tooling_api.select(state, 'tag', 'mod') is mod
+    assert len(state.violations) > 0
+    assert violations(state) == [(violation.function.address, violation.address, violation.message)
+                                 for violation in verify(LuaBytecode.read(open(path, 'rb').read()))]
+
+def test_reload_reordered_functions(tmp_path):
+    path = str(tmp_path / 'math.out')
+    shutil.copy(os.path.join(SIMPLE, 'math.out'), path)
+    rewrite(path, lambda bytecode: setattr(bytecode.chunks[5].value, 'maxStackSize', 1))
+    state = tooling_api.open(path, watch=True)
+    functions = state.working_code.chunks
+    for function, name in zip(functions[1:], ['add', 'sub', 'mul', 'div', 'mod']):
+        tooling_api.tag(state, function, name)
+    before = {function.userDefinedTag: opcodes(function) for function in functions[1:]}
+    main = tooling_api.disassemble(state, functions[0], 'pseudo')
+
+    rewrite(path, lambda bytecode: bytecode.chunks[0].value.chunks.reverse())
+    assert tooling_api.reload(state) == 0
+
+    functions = state.working_code.chunks
+    assert [function.userDefinedTag for function in functions[1:]] == ['mod', 'div', 'mul', 'sub', 'add']
+    assert {function.userDefinedTag: opcodes(function) for function in functions[1:]} == before
+    assert tooling_api.select(state, 'tag', 'add').address == 0x2ba
+    assert tooling_api.disassemble(state, functions[0], 'pseudo') != main
+
+    # the kept violations of mod moved with it
+    fresh = LuaBytecode.read(open(path, 'rb').read())
+    assert violations(state) == [(violation.function.address, violation.address, violation.message) for violation in verify(fresh)]
+    assert state.violations[0].function is tooling_api.select(state, 'tag', 'mod')
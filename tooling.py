@@ -1,191 +1,304 @@
-from termcolor import colored
-from enum import Enum, auto
 import os
 import argparse
 import sys
+import threading
 
 from output_system import OutputSystem, OutputType
 
 from tooling_state import ToolingState
-from lua_bytecode import LuaBytecode
-from lua_instruction import LuaInstructionType, LuaRegisterName
-from working_data import WorkingDataObjects, WorkingType
+from lua_reader import LuaBytecodeError
+from working_data import WorkingType
+import tooling_api
 
 tool_state = ToolingState()
-
-parser = argparse.ArgumentParser()
-parser.add_argument('file', type=argparse.FileType('rb'), help='File for tooling to work with.')
-
-args = parser.parse_args()
-tool_state.working_file = args.file
-fileString = tool_state.working_file.read()
-tool_state.working_code = LuaBytecode.read(fileString)
+output_system = OutputSystem()
 
 def input_prefix():
     if tool_state.selected_data is None:
-        return f"@{colored('file', 'grey')}>> "
+        return f"@{output_system.color_from_type('file', OutputType.PROMPT)}>> "
     if tool_state.selected_data.userDefinedTag is None:
-        return f"@{colored(str(tool_state.selected_data.type) + ':' + hex(tool_state.selected_data.address), 'grey')}>> "
-    return f"@{colored(str(tool_state.selected_data.type), 'grey') + ':' + colored(tool_state.selected_data.userDefinedTag, 'yellow')}>> "
+        return f"@{output_system.color_from_type(str(tool_state.selected_data.type) + ':' + hex(tool_state.selected_data.address), OutputType.PROMPT)}>> "
+    return f"@{output_system.color_from_type(str(tool_state.selected_data.type), OutputType.PROMPT) + ':' + output_system.color_from_type(tool_state.selected_data.userDefinedTag, OutputType.TAG)}>> "
 
 class ErrorCatchingArgumentParser(argparse.ArgumentParser):
     def error(self, message):
         raise argparse.ArgumentError(None, message)
-    
+
     def exit(self, status=0, message=None):
         raise SystemExit(message)
 
-print(colored("lua-bytecode-tooling", "light_blue"))
-print("")
-print("developed by @matthewg-rev")
-print("type 'help' for help.")
-print("")
+def load_in_background():
+    try:
+        tooling_api.load(tool_state)
+    except Exception as e:
+        # anything escaping here would leave working_code unset and every later command failing on it
+        tool_state.load_error = e
+    finally:
+        tool_state.loaded.set()
 
-output_system = OutputSystem()
+reported_load = False
+
+def wait_for_file():
+    # the prompt is up before parsing finishes, commands that need the file block here until it is loaded
+    global reported_load
+    if not tool_state.loaded.is_set():
+        print(output_system.color_from_type(f"loading {tool_state.working_file}...", OutputType.WARNING))
+        tool_state.loaded.wait()
+
+    if reported_load:
+        return
+    reported_load = True
+    if tool_state.load_error is not None:
+        # counted as an error, a script stops here and exits with a failure status
+        if isinstance(tool_state.load_error, LuaBytecodeError):
+            output_error(f"malformed bytecode: {tool_state.load_error}")
+        else:
+            output_error(f"cannot load {tool_state.working_file}: {tool_state.load_error!r}")
+        sys.exit(1)
+    if len(tool_state.violations) > 0:
+        print(output_system.color_from_type(f"warning: {len(tool_state.violations)} verification issue(s) found, type 'verify' to list them.", OutputType.WARNING))
+
+def reload_working_file():
+    try:
+        decoded = tooling_api.reload(tool_state)
+        if decoded is None:
+            print(output_system.color_from_type("file header changed, reloaded the whole file.", OutputType.WARNING))
+        else:
+            print(output_system.color_from_type(f"file changed, reloaded {decoded} function(s).", OutputType.WARNING))
+    except LuaBytecodeError as e:
+        print(output_system.color_from_type(f"error: malformed bytecode, keeping the previous state: {e}", OutputType.ERROR))
 
 def output_function_signature(data = None):
     if data is None:
         data = tool_state.selected_data
+    print(tooling_api.function_signature(data, output_system))
+
+errors = 0
+
+def output_error(message):
+    global errors
+    errors += 1
+    print(output_system.color_from_type(f"error: {message}", OutputType.ERROR))
+
+def selected_function():
+    if tool_state.selected_data is None:
+        output_error("no data selected.")
+        return None
+    if tool_state.selected_data.type != WorkingType.FUNCTION:
+        output_error("selected data is not a function.")
+        return None
+    return tool_state.selected_data
 
-    functionSignature = "{}[{}] @ {}"
-    kw1 = output_system.color_from_type("function", OutputType.KEYWORD)
-    sizeCode = output_system.color_from_type(str(len(data.value.instructions)), OutputType.NUMBER)
-    if data.userDefinedTag is None:
-        address = output_system.color_from_type(hex(data.address), OutputType.ADDRESS)
-        print(functionSignature.format(kw1, sizeCode, address))
-    else:
-        tag = output_system.color_from_type(data.userDefinedTag, OutputType.TAG)
-        print(functionSignature.format(kw1, sizeCode, tag))
-
-while True:
-    command = input(input_prefix()).split(' ')
-    commandName = command[0]
-    if commandName == 'exit':
-        sys.exit(0)
-    elif commandName == 'pseudo':
-        if tool_state.selected_data is None:
-            print(output_system.color_from_type("error: no data selected.", OutputType.ERROR))
-            continue
-        if tool_state.selected_data.type != WorkingType.FUNCTION:
-            print(output_system.color_from_type("error: selected data is not a function.", OutputType.ERROR))
-            continue
+class Command:
+    def __init__(self, name, handler, help, arguments=[], needs_file=True):
+        self.name = name
+        self.handler = handler
+        self.help = help
+        self.needs_file = needs_file
 
+        # built once, parsing a command line is then the only per-command cost
+        self.parser = ErrorCatchingArgumentParser(prog=name, exit_on_error=False, add_help=False)
+        for names, options in arguments:
+            self.parser.add_argument(*names, **options)
+
+Commands = {}
+
+def register(name, help, arguments=[], needs_file=True):
+    def decorator(handler):
+        Commands[name] = Command(name, handler, help, arguments, needs_file)
+        return handler
+    return decorator
+
+@register('list', "list data of a certain type", [
+    (['type'], {'choices': ['functions', 'instructions', 'constants', 'locals', 'upvalues'], 'help': 'Type of data to list.'})
+])
+def command_list(args):
+    if args.type == 'functions':
+        for data in tooling_api.functions(tool_state):
+            output_function_signature(data)
+    elif args.type in ['instructions', 'constants']:
+        data = selected_function()
+        if data is None:
+            return
         output_function_signature()
+        print('\n'.join(tooling_api.disassemble(tool_state, data, args.type, output_system)))
 
-        output_system.load_format("{:<10} {:<15}")
-        for i, instruction in enumerate(tool_state.selected_data.value.instructions):
-            output_system.add_data(hex(instruction.address), OutputType.ADDRESS)
-            instruction.value.pseudo(output_system)
-            output_system.end_of_line()
-        output_system.print_data()
-        output_system.clear_format()
-    elif commandName == 'addr':
-        if tool_state.selected_data is None:
-            print(output_system.color_from_type("error: no data selected.", OutputType.ERROR))
-            continue
-        print(output_system.color_from_type(hex(tool_state.selected_data.address), OutputType.ADDRESS))
-    elif commandName == 'list':
-        try:
-            parser = ErrorCatchingArgumentParser(exit_on_error=False)
-            parser.add_argument('type', choices=['functions', 'instructions', 'constants', 'locals', 'upvalues'], help='Type of data to list.')
-
-            args = parser.parse_args(command[1:])
-            if args.type == 'functions':
-                for data in WorkingDataObjects:
-                    if data.type == WorkingType.FUNCTION:
-                        output_function_signature(data)
-            
-            elif args.type == 'instructions':
-                if tool_state.selected_data is None:
-                    print(output_system.color_from_type("error: no data selected.", OutputType.ERROR))
-                    continue
-                if tool_state.selected_data.type != WorkingType.FUNCTION:
-                    print(output_system.color_from_type("error: selected data is not a function.", OutputType.ERROR))
-                    continue
-
-                output_function_signature()
-                output_system.load_format("{:<10} {:<15} {:<20} {:<3} {:<3} {:<3}")
-                for i, instruction in enumerate(tool_state.selected_data.value.instructions):
-                    output_system.add_data(hex(instruction.address), OutputType.ADDRESS)
-                    output_system.add_data('[' + str(int(instruction.value.opcode)) + ']', OutputType.NUMBER)
-                    output_system.add_data(instruction.value.opcode, OutputType.INSTRUCTION)
-                    
-                    r1_val = instruction.value.get_register(0)
-                    r2_val = instruction.value.get_register(1)
-                    r3_val = instruction.value.get_register(2)
-
-                    r1_val = str(r1_val) if r1_val is not None else ''
-                    r2_val = str(r2_val) if r2_val is not None else ''
-                    r3_val = str(r3_val) if r3_val is not None else ''
-
-                    output_system.add_data(r1_val, OutputType.REGISTER)
-                    output_system.add_data(r2_val, OutputType.REGISTER)
-                    output_system.add_data(r3_val, OutputType.REGISTER)
-                    output_system.end_of_line()
-                output_system.print_data()
-                output_system.clear_format()
-            elif args.type == 'constants':
-                if tool_state.selected_data is None:
-                    print(output_system.color_from_type("error: no data selected.", OutputType.ERROR))
-                    continue
-                if tool_state.selected_data.type != WorkingType.FUNCTION:
-                    print(output_system.color_from_type("error: selected data is not a function.", OutputType.ERROR))
-                    continue
-
-                output_function_signature()
-                
-                output_system.load_format("{:<10} {}{}{:<10} {:<20}")
-                for i, constant in enumerate(tool_state.selected_data.value.constants):
-                    output_system.add_data(hex(constant.address), OutputType.ADDRESS)
-
-                    output_system.add_data('[')
-                    output_system.add_data(str(constant.value.type), OutputType.CONSTANTTYPE)
-                    output_system.add_data(']')
-
-                    output_system.add_data(constant.value.value, OutputType.CONSTANT)
-                    output_system.end_of_line()
-                output_system.print_data()
-                output_system.clear_format()
-        except argparse.ArgumentError as e:
-            print(output_system.color_from_type(f"error: {e}", OutputType.ERROR))
-            continue
-    elif commandName == 'select':
-        try:
-            parser = ErrorCatchingArgumentParser(exit_on_error=False)
-            parser.add_argument('type', choices=['address', 'tag'], help='Address of data to select.')
-            parser.add_argument('value', type=str, help='value with respect to type.')
-
-            args = parser.parse_args(command[1:])
-            if args.type == 'address':
-                address = int(args.value, 16)
-                for data in WorkingDataObjects:
-                    if data.address == address:
-                        tool_state.selected_data = data
-                        break
-            elif args.type == 'tag':
-                for data in WorkingDataObjects:
-                    if data.userDefinedTag == args.value:
-                        tool_state.selected_data = data
-                        break
-        except argparse.ArgumentError as e:
-            print(output_system.color_from_type(f"error: {e}", OutputType.ERROR))
-            continue
-    elif commandName == 'tag':
+@register('pseudo', "print pseudo code of the selected function", [
+    (['--fold'], {'action': 'store_true', 'help': 'fold single-use temporaries into the expressions using them.'})
+])
+def command_pseudo(args):
+    data = selected_function()
+    if data is None:
+        return
+    output_function_signature()
+    print('\n'.join(tooling_api.disassemble(tool_state, data, 'fold' if args.fold else 'pseudo', output_system)))
+
+@register('select', "select data by address or tag", [
+    (['type'], {'choices': ['address', 'tag'], 'help': 'Address of data to select.'}),
+    (['value'], {'type': str, 'help': 'value with respect to type.'})
+])
+def command_select(args):
+    try:
+        tooling_api.select(tool_state, args.type, args.value)
+    except ValueError as e:
+        output_error(e)
+
+@register('tag', "tag the selected data", [
+    (['tag'], {'type': str, 'help': 'tag for the selected data.'})
+])
+def command_tag(args):
+    if tool_state.selected_data is not None:
+        tooling_api.tag(tool_state, tool_state.selected_data, args.tag)
+
+@register('addr', "print the address of the selected data")
+def command_addr(args):
+    if tool_state.selected_data is None:
+        output_error("no data selected.")
+        return
+    print(output_system.color_from_type(hex(tool_state.selected_data.address), OutputType.ADDRESS))
+
+@register('verify', "list bytecode verification issues")
+def command_verify(args):
+    if len(tool_state.violations) == 0:
+        print("no verification issues found.")
+        return
+    for violation in tool_state.violations:
+        function = violation.function
+        where = function.userDefinedTag if function.userDefinedTag is not None else hex(function.address)
+        print(f"{output_system.color_from_type(where, OutputType.TAG if function.userDefinedTag is not None else OutputType.ADDRESS)} "
+              f"{output_system.color_from_type(hex(violation.address), OutputType.ADDRESS)} "
+              f"{output_system.color_from_type(violation.message, OutputType.WARNING)}")
+
+@register('callers', "list functions calling the selected function", [
+    (['--all'], {'action': 'store_true', 'help': 'include indirect callers.'})
+])
+def command_callers(args):
+    data = selected_function()
+    if data is None:
+        return
+    for function in tooling_api.callers(tool_state, data, args.all):
+        output_function_signature(function)
+
+@register('callees', "list functions called by the selected function", [
+    (['--all'], {'action': 'store_true', 'help': 'include indirect callees.'})
+])
+def command_callees(args):
+    data = selected_function()
+    if data is None:
+        return
+    for function in tooling_api.callees(tool_state, data, args.all):
+        output_function_signature(function)
+
+@register('search', "find opcode sequences, e.g. search GETGLOBAL[K=\"print\"]; LOADK; CALL", [
+    (['pattern'], {'nargs': '+', 'help': 'pattern to search for.'})
+])
+def command_search(args):
+    from pattern_search import PatternError
+    try:
+        matches = tooling_api.search(tool_state, [' '.join(args.pattern)])
+    except PatternError as e:
+        output_error(e)
+        return
+
+    for match in matches:
+        print(f"{tooling_api.function_signature(match.function, output_system)} "
+              f"{output_system.color_from_type(hex(match.address()), OutputType.ADDRESS)}")
+    print(f"{output_system.color_from_type(len(matches), OutputType.NUMBER)} match(es)")
+
+@register('stats', "opcode frequencies of the working file")
+def command_stats(args):
+    data = tooling_api.stats(tool_state)
+    print(f"{output_system.color_from_type(data['functions'], OutputType.NUMBER)} functions, "
+          f"{output_system.color_from_type(data['instructions'], OutputType.NUMBER)} instructions")
+
+    output_system.load_format("{:<20} {:<10}")
+    for opcode, count in sorted(data['opcodes'].items(), key=lambda item: -item[1]):
+        output_system.add_data(opcode, OutputType.INSTRUCTION)
+        output_system.add_data(count, OutputType.NUMBER)
+        output_system.end_of_line()
+    output_system.print_data()
+    output_system.clear_format()
+
+@register('clear', "clear the screen", needs_file=False)
+def command_clear(args):
+    os.system('cls')
+
+@register('exit', "exit the tooling", needs_file=False)
+def command_exit(args):
+    sys.exit(0)
+
+@register('help', "print this help message", needs_file=False)
+def command_help(args):
+    for command in Commands.values():
+        print(f"{command.name}: {command.help}")
+
+def run_command(line):
+    words = line.split()
+    if len(words) == 0 or words[0].startswith('#'):
+        return
+
+    command = Commands.get(words[0])
+    if command is None:
+        output_error(f"unknown command '{words[0]}', type 'help' for help.")
+        return
+    if command.needs_file:
+        wait_for_file()
+        if tooling_api.changed(tool_state):
+            reload_working_file()
+
+    try:
+        args = command.parser.parse_args(words[1:])
+    except argparse.ArgumentError as e:
+        output_error(e)
+        return
+    command.handler(args)
+
+def run_script(lines):
+    # non-interactive: no banner or prompt, the exit status reports whether any command failed
+    try:
+        for line in lines:
+            run_command(line)
+    except SystemExit:
+        pass
+    sys.exit(1 if errors > 0 else 0)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=argparse.FileType('rb'), help='File for tooling to work with.')
+    parser.add_argument('--no-verify', action='store_true', help='Skip verifying the bytecode after loading.')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Decode prototypes of large files in this many processes.')
+    parser.add_argument('-w', '--watch', action='store_true', help='Reload changed functions when the file changes on disk.')
+    parser.add_argument('--plain', action='store_true', help='Print without colors.')
+    parser.add_argument('-s', '--script', type=argparse.FileType('r'), default=None, help='Run commands from this file instead of the prompt, - for stdin.')
+    parser.add_argument('-i', '--interactive', action='store_true', help='Show the prompt even when stdin is not a terminal.')
+
+    cli_args = parser.parse_args()
+    cli_args.file.close()
+
+    tool_state.working_file = cli_args.file.name
+    tool_state.workers = cli_args.workers
+    tool_state.verify = not cli_args.no_verify
+    tool_state.watch = cli_args.watch
+    output_system.colored = not cli_args.plain
+
+    threading.Thread(target=load_in_background, daemon=True).start()
+
+    # commands piped into stdin run as a script as well, unless the prompt was asked for
+    if cli_args.script is not None or not (sys.stdin.isatty() or cli_args.interactive):
+        run_script(cli_args.script if cli_args.script is not None else sys.stdin)
+
+    print(output_system.color_from_type("lua-bytecode-tooling", OutputType.TITLE))
+    print("")
+    print("developed by @matthewg-rev")
+    print("type 'help' for help.")
+    print("")
+
+    while True:
         try:
-            parser = ErrorCatchingArgumentParser(exit_on_error=False)
-            parser.add_argument('tag', type=str, help='tag for the selected data.')
-
-            args = parser.parse_args(command[1:])
-            if tool_state.selected_data is not None:
-                tool_state.selected_data.userDefinedTag = args.tag
-        except argparse.ArgumentError as e:
-            print(output_system.color_from_type(f"error: {e}", OutputType.ERROR))
-            continue
-    elif commandName == 'clear':
-        os.system('cls')
-    elif commandName == 'help':
-        print("list: list data of a certain type")
-        print("select: select data by address or tag")
-        print("tag: tag the selected data")
-        print("exit: exit the tooling")
-        print("help: print this help message")
\ No newline at end of file
+            line = input(input_prefix())
+        except EOFError:
+            sys.exit(0)
+        run_command(line)
+
+if __name__ == '__main__':
+    main()
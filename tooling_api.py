@@ -0,0 +1,235 @@
+import io
+
+from output_system import OutputSystem, OutputType
+from tooling_state import ToolingState
+from lua_bytecode import LuaBytecode
+from lua_verifier import verify, verify_chunk
+from render_cache import RenderCache
+from working_data import WorkingType
+
+# heavier modules (process pools, hashing, graph and statistics code) are imported where they are used,
+# so importing this module and opening a small file stays cheap
+
+def open(path, workers=None, verify=True, watch=False):
+    state = ToolingState()
+    state.working_file = path
+    state.workers = workers
+    state.verify = verify
+    state.watch = watch
+    load(state)
+    return state
+
+def load(state):
+    # the state looks data up in its own bytecode, nothing read here registers with WorkingDataObjects,
+    # so several states can be open at once
+    violations = [] if state.verify else None
+    if state.workers is not None:
+        # the workers verify what they decode, functions are only decoded here once they are looked at
+        from parallel_reader import read_parallel
+        state.working_code = read_parallel(state.working_file, state.workers, violations)
+    else:
+        # reopen by name, editors often replace the file rather than rewriting it
+        with io.open(state.working_file, 'rb') as file:
+            fileString = file.read()
+        state.working_code = LuaBytecode.read(fileString, register=False)
+        if violations is not None:
+            violations.extend(verify(state.working_code))
+
+    state.violations = violations if violations is not None else []
+    state.call_graph = None
+    reset_indexes(state)
+    state.render_cache = RenderCache()
+    if state.watch:
+        from file_watcher import FileWatcher
+        state.watcher = FileWatcher(state.working_file, state.working_code)
+    state.loaded.set()
+
+def changed(state):
+    return state.watcher is not None and state.watcher.changed()
+
+def reload(state):
+    # returns the number of re-decoded functions, or None when the whole file had to be read again
+    reloaded = state.watcher.reload()
+    if reloaded is None:
+        load(state)
+        state.selected_data = None
+        return None
+
+    decoded, remapped = reloaded
+    if state.selected_data is not None:
+        state.selected_data = remapped.get(id(state.selected_data), state.selected_data)
+    if state.verify:
+        state.violations = reverify(state, decoded)
+    state.call_graph = None
+    reset_indexes(state)
+    return len(decoded)
+
+def reverify(state, decoded):
+    # only the re-decoded functions are verified again, the violations of the others are kept; they refer to
+    # instructions by pc and their addresses follow the functions when they move
+    decodedChunks = set(id(chunk) for chunk in decoded)
+    kept = {}
+    for violation in state.violations:
+        kept.setdefault(id(violation.function), []).append(violation)
+
+    violations = []
+    for function in state.working_code.chunks:
+        if id(function.value) in decodedChunks:
+            violations.extend(verify_chunk(function))
+        else:
+            violations.extend(kept.get(id(function), []))
+    return violations
+
+def functions(state):
+    return list(state.working_code.chunks)
+
+def reset_indexes(state):
+    state.address_index = None
+    state.tag_index = None
+    state.parents = None
+
+def build_index(state, key):
+    # first data in read order wins, as with a linear search
+    index = {}
+    for data in state.working_code.working_data():
+        value = key(data)
+        if value is not None and value not in index:
+            index[value] = data
+    return index
+
+def select(state, type, value):
+    # type is 'address' (hex string or int) or 'tag'
+    if type == 'address':
+        if state.address_index is None:
+            state.address_index = build_index(state, lambda data: data.address)
+        data = state.address_index.get(int(value, 16) if isinstance(value, str) else value)
+    else:
+        if state.tag_index is None:
+            state.tag_index = build_index(state, lambda data: data.userDefinedTag)
+        data = state.tag_index.get(value)
+
+    if data is not None:
+        state.selected_data = data
+    return data
+
+def tag(state, data, tag):
+    previous = data.userDefinedTag
+    data.userDefinedTag = tag
+    if state.tag_index is not None:
+        if previous is not None or tag in state.tag_index:
+            state.tag_index = None
+        else:
+            state.tag_index[tag] = data
+
+    if data.type == WorkingType.FUNCTION and state.render_cache is not None:
+        # function tags are printed by the CLOSURE lines of the parent
+        if state.parents is None:
+            state.parents = {id(child): parent.value for parent in state.working_code.chunks for child in parent.value.chunks}
+        parent = state.parents.get(id(data.value))
+        if parent is not None:
+            state.render_cache.invalidate(parent)
+
+def function_signature(data, output_system):
+    functionSignature = "{}[{}] @ {}"
+    kw1 = output_system.color_from_type("function", OutputType.KEYWORD)
+    sizeCode = output_system.color_from_type(str(len(data.value.instructions)), OutputType.NUMBER)
+    if data.userDefinedTag is None:
+        address = output_system.color_from_type(hex(data.address), OutputType.ADDRESS)
+        return functionSignature.format(kw1, sizeCode, address)
+    tag = output_system.color_from_type(data.userDefinedTag, OutputType.TAG)
+    return functionSignature.format(kw1, sizeCode, tag)
+
+def render_pseudo(chunk, output_system):
+    output_system.load_format("{:<10} {:<15}")
+    for i, instruction in enumerate(chunk.instructions):
+        output_system.add_data(hex(instruction.address), OutputType.ADDRESS)
+        instruction.value.pseudo(output_system)
+        output_system.end_of_line()
+    lines = output_system.render_data()
+    output_system.clear_format()
+    return lines
+
+def render_folded(chunk, output_system):
+    from expression_folding import fold_chunk
+    return fold_chunk(chunk, output_system)
+
+def render_instructions(chunk, output_system):
+    output_system.load_format("{:<10} {:<15} {:<20} {:<3} {:<3} {:<3}")
+    for i, instruction in enumerate(chunk.instructions):
+        output_system.add_data(hex(instruction.address), OutputType.ADDRESS)
+        output_system.add_data('[' + str(int(instruction.value.opcode)) + ']', OutputType.NUMBER)
+        output_system.add_data(instruction.value.opcode, OutputType.INSTRUCTION)
+
+        r1_val = instruction.value.get_register(0)
+        r2_val = instruction.value.get_register(1)
+        r3_val = instruction.value.get_register(2)
+
+        r1_val = str(r1_val) if r1_val is not None else ''
+        r2_val = str(r2_val) if r2_val is not None else ''
+        r3_val = str(r3_val) if r3_val is not None else ''
+
+        output_system.add_data(r1_val, OutputType.REGISTER)
+        output_system.add_data(r2_val, OutputType.REGISTER)
+        output_system.add_data(r3_val, OutputType.REGISTER)
+        output_system.end_of_line()
+    lines = output_system.render_data()
+    output_system.clear_format()
+    return lines
+
+def render_constants(chunk, output_system):
+    output_system.load_format("{:<10} {}{}{:<10} {:<20}")
+    for i, constant in enumerate(chunk.constants):
+        output_system.add_data(hex(constant.address), OutputType.ADDRESS)
+
+        output_system.add_data('[')
+        output_system.add_data(str(constant.value.type), OutputType.CONSTANTTYPE)
+        output_system.add_data(']')
+
+        output_system.add_data(constant.value.value, OutputType.CONSTANT)
+        output_system.end_of_line()
+    lines = output_system.render_data()
+    output_system.clear_format()
+    return lines
+
+Renderers = {
+    'pseudo': render_pseudo,
+    'fold': render_folded,
+    'instructions': render_instructions,
+    'constants': render_constants
+}
+
+def disassemble(state, data, kind='pseudo', output_system=None):
+    # rendered lines of a function, served from the state's render cache when possible
+    if output_system is None:
+        output_system = OutputSystem()
+        output_system.colored = False
+
+    chunk = data.value
+    cache = state.render_cache if state is not None else None
+    lines = cache.get(chunk, kind, output_system.colored) if cache is not None else None
+    if lines is None:
+        lines = Renderers[kind](chunk, output_system)
+        if cache is not None:
+            cache.put(chunk, kind, output_system.colored, lines)
+    return lines
+
+def callers(state, data, transitive=False):
+    if state.call_graph is None:
+        from call_graph import CallGraph
+        state.call_graph = CallGraph(state.working_code)
+    return state.call_graph.callers(data, transitive)
+
+def callees(state, data, transitive=False):
+    if state.call_graph is None:
+        from call_graph import CallGraph
+        state.call_graph = CallGraph(state.working_code)
+    return state.call_graph.callees(data, transitive)
+
+def search(state, patterns):
+    # patterns are source strings as accepted by pattern_search.parse_patterns
+    from pattern_search import PatternAutomaton, parse_patterns
+    return PatternAutomaton(parse_patterns(patterns)).search(state.working_code)
+
+def stats(state):
+    from opcode_stats import file_stats, report
+    return report(file_stats(state.working_file))
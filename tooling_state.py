@@ -1,8 +1,22 @@
 from enum import Enum
+import threading
 
 class ToolingState:
     def __init__(self):
         self.working_file = None
         self.working_code = None
+        self.load_error = None
+        self.loaded = threading.Event()
+
+        self.workers = None
+        self.verify = True
+        self.watch = False
+        self.violations = []
+        self.watcher = None
+        self.call_graph = None
+        self.render_cache = None
+        self.address_index = None
+        self.tag_index = None
+        self.parents = None
         
         self.selected_data = None
\ No newline at end of file
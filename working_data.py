@@ -16,16 +16,17 @@ class WorkingType(Enum):
 
 
 class WorkingData:
-    def __init__(self):
+    def __init__(self, register=True):
         self.userDefinedTag = None # for user-defined naming of data
 
         self.type = None
         self.address = None
         self.value = None
-        WorkingDataObjects.append(self)
+        if register:
+            WorkingDataObjects.append(self)
 
-    def from_data(type, address, value):
-        data = WorkingData()
+    def from_data(type, address, value, register=True):
+        data = WorkingData(register)
         data.type = type
         data.address = address
         data.value = value